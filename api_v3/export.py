@@ -0,0 +1,122 @@
+import csv
+import json
+from datetime import datetime
+from io import StringIO
+
+from django.utils import timezone
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from main.models import Cash, Category, Expenditure
+
+CHUNK_SIZE = 2000
+
+# Exported fields of each model, with the field filtered by the from and to parameters
+EXPORTS = [
+    ("category", Category, ["id", "name"], None),
+    (
+        "cash",
+        Cash,
+        ["id", "name", "value", "reference_date", "income"],
+        "reference_date",
+    ),
+    (
+        "expenditure",
+        Expenditure,
+        [
+            "id",
+            "name",
+            "value",
+            "date",
+            "is_expected",
+            "category",
+            "expected_expenditure",
+            "user",
+        ],
+        "date",
+    ),
+]
+
+CSV_COLUMNS = ["type"] + list(
+    dict.fromkeys(field for _, _, fields, _ in EXPORTS for field in fields)
+)
+
+
+def _local(value):
+    # Dates are exported in the local time, as the API does
+    return timezone.localtime(value) if isinstance(value, datetime) else value
+
+
+def export_rows(database, min_date=None, max_date=None):
+    """
+    Yield the categories, cashes and expenditures of database as dicts, with their type.
+    Rows are read with server-side cursors (where the database supports them) in chunks.
+    """
+    for row_type, model, fields, date_field in EXPORTS:
+        queryset = model.objects.filter(db=database)
+        if date_field is not None and min_date is not None:
+            queryset = queryset.filter(**{f"{date_field}__gte": min_date})
+        if date_field is not None and max_date is not None:
+            queryset = queryset.filter(**{f"{date_field}__lte": max_date})
+        for values in queryset.order_by("id").values_list(*fields).iterator(CHUNK_SIZE):
+            yield {
+                "type": row_type,
+                **{field: _local(value) for field, value in zip(fields, values)},
+            }
+
+
+def _chunked(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+class JSONLinesRenderer(BaseRenderer):
+    """One JSON object per line."""
+
+    media_type = "application/jsonl"
+    format = "jsonl"
+    charset = "utf-8"
+
+    def stream(self, rows):
+        return _chunked(
+            json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + "\n" for row in rows
+        )
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = data if isinstance(data, list) else [data]
+        return "".join(self.stream(rows)).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """Rows of every type in one table, with the columns of all the types."""
+
+    media_type = "text/csv"
+    format = "csv"
+    charset = "utf-8"
+
+    def _lines(self, rows, columns):
+        buffer = StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    def stream(self, rows, columns=CSV_COLUMNS):
+        return _chunked(self._lines(rows, columns))
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Used for errors
+        rows = data if isinstance(data, list) else [data]
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        return "".join(self.stream(rows, columns)).encode(self.charset)
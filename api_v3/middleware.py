@@ -1,46 +1,71 @@
-from datetime import datetime
-from django.utils import timezone
-from dateutil.relativedelta import relativedelta
-from urllib import parse
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils.decorators import sync_and_async_middleware
+
+from . import profiling, timing
 
 RESERVED_QUERYSTRING_KEYS = [
     "month",
 ]
 
 
-def parseQueryString(get_response):
-    def middleware(request):
-        # Thing executed before
-        qs = parse.parse_qs(request.META["QUERY_STRING"])
-        request.params = qs
-        response = get_response(request)
-        # Thing executed after next middleware
-        return response
+@sync_and_async_middleware
+def serverTiming(get_response):
+    """
+    Records the queries, database, serializer and total times of the requests, sends them
+    in a Server-Timing header and logs the slow requests (see api_v3.timing).
+    Not in the middleware chain at all unless settings.API_TIMING.
+    """
+    if not settings.API_TIMING:
+        raise MiddlewareNotUsed
+    timing.enable()
 
-    return middleware
+    if iscoroutinefunction(get_response):
 
+        async def middleware(request):
+            token = timing.start()
+            try:
+                response = await get_response(request)
+            finally:
+                recorder = timing.stop(token)
+            return timing.report(request, response, recorder)
 
-def _analyze_request_month(request):
-    month = request.params.get("month", [request.headers.get("month", None)])[0]
-    if month:
-        month, year = [int(x.strip()) for x in month.split("-")[:2]]
     else:
-        n = datetime.now()
-        month = n.month
-        year = n.year
-    min_date = datetime(year, month, 1)
-    max_date = min_date + relativedelta(months=1)
-    request.min_date = timezone.make_aware(min_date)
-    request.max_date = timezone.make_aware(max_date)
-    return request
 
+        def middleware(request):
+            token = timing.start()
+            try:
+                response = get_response(request)
+            finally:
+                recorder = timing.stop(token)
+            return timing.report(request, response, recorder)
+
+    return middleware
+
+
+def profileRequest(get_response):
+    """
+    Runs the /v3/ requests of staff users sending X-Profile: 1 under cProfile, saves the
+    stats and the queries in settings.API_PROFILE_DIR and returns the id of the profile in
+    an X-Profile-Id header (see api_v3.profiling). Last in the chain, after authentication.
+    Queries are only recorded during profiled requests, other requests do not pay for it.
+    Sync only: cProfile profiles a single thread, under ASGI Django then runs this
+    middleware in the thread the view runs in.
+    """
+    if not settings.API_PROFILE_DIR:
+        raise MiddlewareNotUsed
 
-def parseMonth(get_response):
     def middleware(request):
-        # Thing executed before
-        request = _analyze_request_month(request)
-        response = get_response(request)
-        # Thing executed after next middleware
-        return response
+        if not profiling.wants_profile(request) or not profiling.is_staff(request):
+            return get_response(request)
+        profile_id, profiler, tokens = profiling.start()
+        queries = profiling.record_queries()
+        try:
+            response = get_response(request)
+        finally:
+            queries.close()
+            recorder = profiling.stop(profiler, tokens)
+        return profiling.save(profile_id, profiler, recorder, request, response)
 
     return middleware
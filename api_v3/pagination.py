@@ -0,0 +1,154 @@
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from datetime import date
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def _encode_value(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Opt-in cursor pagination, enabled by the pageSize or cursor parameters.
+
+    Pages are sorted by the view's cursor_ordering (id by default) and the cursor holds the
+    values of the last returned row, so that the next page is fetched with a WHERE on them:
+    no COUNT(*) and no OFFSET, deep pages cost as much as the first one.
+    The last field of the ordering must be unique. Nulls of nullable fields come last, in
+    either direction, so that their rows are not lost at a page boundary.
+    Without the parameters the whole queryset is returned, unpaginated.
+    """
+
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 500
+    page_size_query_param = "pageSize"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor."
+
+    def _is_requested(self, request):
+        return (
+            self.page_size_query_param in request.params
+            or self.cursor_query_param in request.params
+        )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.params[self.page_size_query_param][0])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_ordering(self, view):
+        return list(getattr(view, "cursor_ordering", ["id"]))
+
+    def decode_cursor(self, request):
+        encoded = request.params.get(self.cursor_query_param, [None])[0]
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(b64decode(encoded.encode("ascii")).decode("utf-8"))
+        except (TypeError, ValueError, UnicodeError, BinasciiError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        return b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+    def _nullable(self, queryset, name):
+        try:
+            return queryset.model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            return False
+
+    def _order_by(self, field):
+        name = field.lstrip("-")
+        if name not in self.nullable:
+            return field
+        if field.startswith("-"):
+            return F(name).desc(nulls_last=True)
+        return F(name).asc(nulls_last=True)
+
+    def _after(self, position):
+        """Rows following position in the ordering: (a, b) > (x, y) is a > x or (a = x and b > y)."""
+        query = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            if value is None:
+                # Nulls come last: rows can only follow a null on the next fields
+                equal &= Q(**{f"{name}__isnull": True})
+                continue
+            lookup = "lt" if field.startswith("-") else "gt"
+            after = Q(**{f"{name}__{lookup}": value})
+            if name in self.nullable:
+                after |= Q(**{f"{name}__isnull": True})
+            query |= equal & after
+            equal &= Q(**{name: value})
+        return query
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self._is_requested(request):
+            return None
+        self.request = request
+        self.ordering = self.get_ordering(view)
+        page_size = self.get_page_size(request)
+        self.nullable = {
+            field.lstrip("-")
+            for field in self.ordering
+            if self._nullable(queryset, field.lstrip("-"))
+        }
+
+        queryset = queryset.order_by(
+            *(self._order_by(field) for field in self.ordering)
+        )
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._after(position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # One row more than needed tells whether there is a next page
+        results = list(queryset[: page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [
+            _encode_value(getattr(last, field.lstrip("-"))) for field in self.ordering
+        ]
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(position),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({"next": self.get_next_link(), "results": data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
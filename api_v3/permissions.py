@@ -1,5 +1,14 @@
 from rest_framework import permissions
 
+from main.models import get_user_db_ids
+
+
+def get_db_ids(request):
+    """Ids of the databases of the user of request, computed once per request."""
+    if not hasattr(request, '_db_ids'):
+        request._db_ids = get_user_db_ids(request.user)
+    return request._db_ids
+
 
 class UserPermission(permissions.IsAuthenticated):
     def has_object_permission(self, request, view, obj):
@@ -15,7 +24,7 @@ class DBPermission(permissions.IsAuthenticated):
     def has_object_permission(self, request, view, obj):
         return (
             super().has_object_permission(request, view, obj)
-            and obj.users.filter(id=request.user.id).exists()
+            and obj.id in get_db_ids(request)
         )
 
 
@@ -24,5 +33,5 @@ class DBRelatedPermission(permissions.IsAuthenticated):
     def has_object_permission(self, request, view, obj):
         return (
             super().has_object_permission(request, view, obj)
-            and obj.db.users.filter(id=request.user.id).exists()
+            and obj.db_id in get_db_ids(request)
         )
@@ -0,0 +1,126 @@
+import contextvars
+import cProfile
+import json
+import os
+import time
+import uuid
+from contextlib import ExitStack, suppress
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import timing
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+_profile_id = contextvars.ContextVar("api_v3_profile_id", default=None)
+
+
+def active():
+    """Whether the current request is profiled."""
+    return _profile_id.get() is not None
+
+
+def wants_profile(request):
+    """Cheap check of the header, before authenticating the user."""
+    return request.headers.get(PROFILE_HEADER, None) == "1" and request.path.startswith(
+        "/v3/"
+    )
+
+
+def is_staff(request):
+    """
+    Authenticate request as the API views will, the middlewares only know session users.
+    The user of the request is left untouched.
+    """
+    user = getattr(request, "user", None)
+    drf_request = Request(
+        request,
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+    )
+    try:
+        return drf_request.user.is_staff
+    except APIException:
+        return False
+    finally:
+        if user is None:
+            request.__dict__.pop("user", None)
+        else:
+            request.user = user
+
+
+def new_profile_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+
+def record_queries():
+    """
+    Record the queries of the connections of the current thread in the timings of the
+    profiled request, unless serverTiming already records those of every connection.
+    Returns an ExitStack to close in the same thread when the request is done.
+    """
+    stack = ExitStack()
+    if not timing.enabled():
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timing.record_query))
+    return stack
+
+
+def start():
+    profile_id = new_profile_id()
+    profiler = cProfile.Profile()
+    tokens = (_profile_id.set(profile_id), timing.start(log_queries=True))
+    profiler.enable()
+    return profile_id, profiler, tokens
+
+
+def stop(profiler, tokens):
+    profiler.disable()
+    profile_token, timing_token = tokens
+    recorder = timing.stop(timing_token)
+    _profile_id.reset(profile_token)
+    return recorder
+
+
+def prune(directory, keep):
+    """Delete the oldest profiles of directory, so that keep of them are left."""
+    profiles = sorted(
+        (entry.stat().st_mtime, entry.name[: -len(".json")])
+        for entry in os.scandir(directory)
+        if entry.name.endswith(".json")
+    )
+    for _, profile_id in profiles[: max(len(profiles) - keep, 0)]:
+        for extension in (".json", ".prof"):
+            # Concurrent requests may prune the same profiles
+            with suppress(FileNotFoundError):
+                os.remove(os.path.join(directory, profile_id + extension))
+
+
+def save(profile_id, profiler, recorder, request, response):
+    """
+    Write the stats of profiler to API_PROFILE_DIR/<profile_id>.prof, for pstats or
+    snakeviz, and the request and its queries to API_PROFILE_DIR/<profile_id>.json.
+    Only the API_PROFILE_KEEP latest profiles are kept.
+    """
+    os.makedirs(settings.API_PROFILE_DIR, exist_ok=True)
+    path = os.path.join(settings.API_PROFILE_DIR, profile_id)
+    profiler.dump_stats(f"{path}.prof")
+    annotation = {
+        "id": profile_id,
+        "method": request.method,
+        "path": request.get_full_path(),
+        "status": response.status_code,
+        "total_ms": round(recorder.total * 1000, 1),
+        "serializer_ms": round(recorder.serializer * 1000, 1),
+        "db_ms": round(recorder.db * 1000, 1),
+        "queries": recorder.log,
+    }
+    with open(f"{path}.json", "w") as f:
+        json.dump(annotation, f, indent=2, default=str)
+    prune(settings.API_PROFILE_DIR, settings.API_PROFILE_KEEP)
+    response[PROFILE_ID_HEADER] = profile_id
+    return response
@@ -0,0 +1,54 @@
+from datetime import datetime
+from urllib import parse
+
+from dateutil.relativedelta import relativedelta
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.views import APIView
+
+from .serializers.utils import parse_month
+
+
+class ParsedRequest(Request):
+    """
+    Request of the API views: params, min_date and max_date are computed the first time they
+    are used, so requests not using them do not pay for them. They can still be assigned, as
+    tests do.
+    """
+
+    @cached_property
+    def params(self):
+        return parse.parse_qs(self.META["QUERY_STRING"])
+
+    @cached_property
+    def min_date(self):
+        month = self.params.get("month", [self.headers.get("month", None)])[0]
+        if not month:
+            n = datetime.now()
+            return timezone.make_aware(datetime(n.year, n.month, 1))
+        try:
+            return parse_month(month)
+        except ValueError:
+            raise ValidationError({"month": ["Month must be in the mm-yyyy format."]})
+
+    @cached_property
+    def max_date(self):
+        return self.min_date + relativedelta(months=1)
+
+
+class ParsedRequestMixin(APIView):
+    """
+    Views get a ParsedRequest. Listed after the viewset classes in the bases of a viewset, it
+    comes after ViewSetMixin, whose initialize_request still sets the action.
+    """
+
+    def initialize_request(self, request, *args, **kwargs):
+        return ParsedRequest(
+            request,
+            parsers=self.get_parsers(),
+            authenticators=self.get_authenticators(),
+            negotiator=self.get_content_negotiator(),
+            parser_context=self.get_parser_context(request),
+        )
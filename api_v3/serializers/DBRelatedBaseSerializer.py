@@ -1,15 +1,152 @@
-from rest_framework import serializers
+from collections.abc import Mapping
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework import exceptions, serializers
 
 from main.models import Database
 
+from ..permissions import get_db_ids
+
+
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that looks up the instances fetched at once by a list serializer in
+    context['prefetched'][field_name] (a dict mapping pks to instances) instead of querying
+    them one by one.
+    """
+
+    def to_pk(self, data):
+        if isinstance(data, bool):
+            return None
+        try:
+            return self.get_queryset().model._meta.pk.to_python(data)
+        except (TypeError, ValidationError):
+            return None
+
+    def to_internal_value(self, data):
+        prefetched = self.context.get('prefetched', {}).get(self.field_name, None)
+        if prefetched is None:
+            return super().to_internal_value(data)
+        pk = self.to_pk(data)
+        if pk is None:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in prefetched:
+            self.fail('does_not_exist', pk_value=data)
+        return prefetched[pk]
+
+
+def prefetch_related_fields(serializer, data, querysets=None):
+    """
+    Fetch the instances referenced in data (a list of items for serializer) by its
+    PrefetchedPrimaryKeyRelatedFields, with one query per field, and provide them to the
+    fields through the context. querysets may override the queryset of some fields.
+    """
+    querysets = querysets or {}
+    prefetched = {}
+    for name, field in serializer.fields.items():
+        if field.read_only or not isinstance(field, PrefetchedPrimaryKeyRelatedField):
+            continue
+        pks = {
+            field.to_pk(item[name]) for item in data
+            if isinstance(item, Mapping) and item.get(name, None) is not None
+        }
+        pks.discard(None)
+        queryset = querysets.get(name, field.get_queryset())
+        prefetched[name] = queryset.in_bulk(pks) if pks else {}
+    serializer.context['prefetched'] = prefetched
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """
+    Creates and updates many instances at once, with bulk_create and bulk_update.
+    To update, instance is the list of the instances and every item of data has their id.
+    """
+
+    # Querysets used by prefetch_related_fields, by field name
+    prefetch_querysets = {}
+    # Fields written by prepare() when a field is changed
+    derived_fields = {}
+
+    def get_prefetch_querysets(self):
+        return self.prefetch_querysets
+
+    def prepare(self, instance):
+        """Called on every instance before it is written."""
+
+    def get_result_queryset(self):
+        return self.child.Meta.model.objects.all()
+
+    def check_db(self, instance):
+        """Refuse to write instance into a database the user is not a member of."""
+        if instance.db_id not in get_db_ids(self.context['request']):
+            raise exceptions.PermissionDenied()
+
+    def _fetch_results(self, instances):
+        results = self.get_result_queryset().in_bulk([instance.pk for instance in instances])
+        return [results[instance.pk] for instance in instances]
+
+    def _get_instance(self, item):
+        pk = self.child.Meta.model._meta.pk.to_python(item['id'])
+        return self._instances[pk]
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            prefetch_related_fields(self.child, data, self.get_prefetch_querysets())
+        if self.instance is not None:
+            self._instances = {instance.pk: instance for instance in self.instance}
+        return super().to_internal_value(data)
+
+    def run_child_validation(self, data):
+        if self.instance is None:
+            return super().run_child_validation(data)
+        self.child.instance = self._get_instance(data)
+        self.child.initial_data = data
+        try:
+            return super().run_child_validation(data)
+        finally:
+            self.child.instance = None
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        instances = [model(**attrs) for attrs in validated_data]
+        for instance in instances:
+            self.prepare(instance)
+            self.check_db(instance)
+        with transaction.atomic():
+            model.objects.bulk_create(instances)
+        return self._fetch_results(instances)
+
+    def update(self, instances, validated_data):
+        model = self.child.Meta.model
+        fields = set()
+        updated = []
+        for item, attrs in zip(self.initial_data, validated_data):
+            instance = self._get_instance(item)
+            for field, value in attrs.items():
+                setattr(instance, field, value)
+                fields.add(field)
+                fields.update(self.derived_fields.get(field, []))
+            self.prepare(instance)
+            self.check_db(instance)
+            updated.append(instance)
+        # bulk_update does not set auto_now fields as save() does
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False):
+                for instance in updated:
+                    field.pre_save(instance, add=False)
+                fields.add(field.name)
+        with transaction.atomic():
+            model.objects.bulk_update(updated, fields)
+        return self._fetch_results(updated)
+
 
-class ForeignToDBField(serializers.PrimaryKeyRelatedField):
+class ForeignToDBField(PrefetchedPrimaryKeyRelatedField):
     class Meta:
         model = Database
 
     def get_queryset(self):
-        user = self.context['request'].user
-        return Database.objects.filter(users__in=[user])
+        return Database.objects.filter(id__in=get_db_ids(self.context['request']))
 
 
 class DBRelatedBaseSerializer(serializers.ModelSerializer):
@@ -1,10 +1,15 @@
 from rest_framework import serializers
 
+from main.models import summary_month
+
 
 class DateFilterSerializer(serializers.ModelSerializer):
     def gen_current_month(self):
         return self.context["request"].min_date.strftime("%m-%Y")
 
+    def gen_summary_month(self):
+        return summary_month(self.context["request"].min_date)
+
     def gen_filters_for_month(self, field_prefix="date", lt=None, gte=None):
         filters = {}
         filters[f"{field_prefix}__gte"] = (
@@ -2,6 +2,7 @@
 from .database import (
     FullDatabaseSerializer,
     GraphDatabaseSerializer,
+    TimeSeriesDatabaseSerializer,
 )
 from .database_SimpleDatabaseSerializer import SimpleDatabaseSerializer
 
@@ -1,7 +1,7 @@
 from rest_framework import serializers
 from main.models import Cash
 from .DateFilterSerializer import DateFilterSerializer
-from .DBRelatedBaseSerializer import DBRelatedBaseSerializer
+from .DBRelatedBaseSerializer import BulkListSerializer, DBRelatedBaseSerializer
 
 
 class CashSerializer(DateFilterSerializer, DBRelatedBaseSerializer):
@@ -14,6 +14,7 @@ class CashSerializer(DateFilterSerializer, DBRelatedBaseSerializer):
     class Meta:
         model = Cash
         fields = ['id', 'name', 'value', 'date', 'reference_date', 'income', 'db']
+        list_serializer_class = BulkListSerializer
 
     def create(self, validated_data):
         if not validated_data.get('db', None):
@@ -1,14 +1,85 @@
-from django.db.models import Sum
 from decimal import Decimal
+from django.db import models
 from rest_framework import serializers
 
-from main.models import Category
+from main.models import Category, Expenditure, MonthlySummary
 
 from .DateFilterSerializer import DateFilterSerializer
 from .DBRelatedBaseSerializer import DBRelatedBaseSerializer
 
 
-class CategorySerializer(DateFilterSerializer, DBRelatedBaseSerializer):
+def get_categories_summary(month, **filters):
+    """
+    Month totals of the categories matching filters, with a single grouped query.
+    Returns a dict mapping category id to its expected_expenditure and actual_expenditure.
+    """
+    return {
+        row["category"]: row
+        for row in MonthlySummary.objects.filter(
+            month=month, category__isnull=False, **filters
+        )
+        .values("category")
+        .annotate(
+            expected_expenditure=models.Sum("expected_expenditure"),
+            actual_expenditure=models.Sum("actual_expenditure"),
+        )
+        .order_by()
+    }
+
+
+class CategoryProspectSerializer(DateFilterSerializer, DBRelatedBaseSerializer):
+    def _get_month_summary(self, instance):
+        # When many categories are rendered, the summaries are provided all at once
+        categories_summary = self.context.get("categories_summary", None)
+        if categories_summary is not None:
+            return categories_summary.get(instance.id, {})
+        return (
+            instance.monthly_summaries.filter(month=self.gen_summary_month())
+            .values("expected_expenditure", "actual_expenditure")
+            .first()
+        ) or {}
+
+    def _gen_prospect(self, representation, instance):
+        summary = self._get_month_summary(instance)
+        prospect = {}
+        prospect["expected_expenditure"] = summary.get(
+            "expected_expenditure", Decimal(0)
+        )
+        prospect["actual_expenditure"] = summary.get("actual_expenditure", Decimal(0))
+        prospect["delta"] = (
+            prospect["expected_expenditure"] - prospect["actual_expenditure"]
+        )
+        representation["prospect"] = prospect
+
+
+class CategoryListSerializer(serializers.ListSerializer):
+    """
+    Renders many categories with a constant number of queries: the expenditures of the month
+    are prefetched at once and the summaries are fetched with a single grouped query.
+    """
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        categories = list(iterable)
+        models.prefetch_related_objects(
+            categories,
+            models.Prefetch(
+                "expenditures",
+                queryset=Expenditure.objects.filter(
+                    **self.child.gen_filters_for_month()
+                )
+                .only("id", "category_id", "is_expected", "date")
+                .order_by("date"),
+                to_attr="month_expenditures",
+            ),
+        )
+        self.context["categories_summary"] = get_categories_summary(
+            self.child.gen_summary_month(), category__in=categories
+        )
+        return [self.child.to_representation(item) for item in categories]
+
+
+class CategorySerializer(CategoryProspectSerializer):
     def __init__(self, *args, include_children=False, **kwargs):
         self.include_children = include_children
         super().__init__(*args, **kwargs)
@@ -20,44 +91,36 @@ class CategorySerializer(DateFilterSerializer, DBRelatedBaseSerializer):
             "name",
             "db",
         ]
+        list_serializer_class = CategoryListSerializer
 
-    def _gen_prospect(self, representation, instance):
-        prospect = {}
-        prospect["expected_expenditure"] = instance.expenditures.filter(
-            **self.gen_filters_for_month()
-        ).filter(is_expected=True).aggregate(Sum("value"))["value__sum"] or Decimal(0)
-        prospect["actual_expenditure"] = instance.expenditures.filter(
-            **self.gen_filters_for_month()
-        ).filter(is_expected=False).aggregate(Sum("value"))["value__sum"] or Decimal(0)
-        prospect["delta"] = (
-            prospect["expected_expenditure"] - prospect["actual_expenditure"]
-        )
-        representation["prospect"] = prospect
+    def _get_month_expenditures(self, instance, is_expected):
+        if hasattr(instance, "month_expenditures"):
+            # Prefetched by CategoryListSerializer
+            return [
+                expenditure
+                for expenditure in instance.month_expenditures
+                if expenditure.is_expected == is_expected
+            ]
+        return instance.expenditures.filter(
+            **self.gen_filters_for_month(), is_expected=is_expected
+        ).order_by("date")
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
 
         representation["expected_expenditures"] = serializers.PrimaryKeyRelatedField(
             many=True, read_only=True
-        ).to_representation(
-            instance.expenditures.filter(
-                **self.gen_filters_for_month(), is_expected=True
-            ).order_by("date")
-        )
+        ).to_representation(self._get_month_expenditures(instance, True))
         representation["actual_expenditures"] = serializers.PrimaryKeyRelatedField(
             many=True, read_only=True
-        ).to_representation(
-            instance.expenditures.filter(
-                **self.gen_filters_for_month(), is_expected=False
-            ).order_by("date"),
-        )
+        ).to_representation(self._get_month_expenditures(instance, False))
 
         self._gen_prospect(representation, instance)
 
         return representation
 
 
-class GraphsCategorySerializer(DateFilterSerializer, DBRelatedBaseSerializer):
+class GraphsCategorySerializer(CategoryProspectSerializer):
     def __init__(self, *args, include_children=False, **kwargs):
         self.include_children = include_children
         super().__init__(*args, **kwargs)
@@ -71,19 +134,6 @@ class GraphsCategorySerializer(DateFilterSerializer, DBRelatedBaseSerializer):
             "name",
         ]
 
-    def _gen_prospect(self, representation, instance):
-        prospect = {}
-        prospect["expected_expenditure"] = instance.expenditures.filter(
-            **self.gen_filters_for_month()
-        ).filter(is_expected=True).aggregate(Sum("value"))["value__sum"] or Decimal(0)
-        prospect["actual_expenditure"] = instance.expenditures.filter(
-            **self.gen_filters_for_month()
-        ).filter(is_expected=False).aggregate(Sum("value"))["value__sum"] or Decimal(0)
-        prospect["delta"] = (
-            prospect["expected_expenditure"] - prospect["actual_expenditure"]
-        )
-        representation["prospect"] = prospect
-
     def to_representation(self, instance):
         representation = super().to_representation(instance)
         self._gen_prospect(representation, instance)
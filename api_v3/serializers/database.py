@@ -4,11 +4,13 @@ from dateutil import relativedelta
 from decimal import Decimal
 from django.contrib.auth.models import User
 from django.utils import timezone
-from main.models import Database, Cash
+from main.models import Database, Cash, MonthlySummary, summary_month
 from rest_framework import serializers
 
-from .category import GraphsCategorySerializer
-from .utils import extract_value, check_precedent_money_is_valid
+from .category import GraphsCategorySerializer, get_categories_summary
+from .prospect import get_month_figures
+from .sections import run_sections
+from .utils import extract_value, check_precedent_money_is_valid, parse_month
 from .DateFilterSerializer import DateFilterSerializer
 
 
@@ -27,22 +29,6 @@ class FullDatabaseSerializer(DateFilterSerializer):
         model = Database
         fields = ["id", "name", "users", "categories"]
 
-    def _get_actual_money(self, instance):
-        return (
-            instance.cashes.filter(**self.gen_filters_for_month("reference_date"))
-            .filter(income=False)
-            .order_by("reference_date")
-            .last()
-        )
-
-    def _get_precedent_actual_money(self, instance):
-        return (
-            instance.cashes.filter(**self.gen_filters_for_precedent("reference_date"))
-            .filter(income=False)
-            .order_by("reference_date")
-            .last()
-        )
-
     def _get_precedent_actual_money_for_month(self, instance, lt):
         return (
             instance.cashes.filter(
@@ -53,28 +39,23 @@ class FullDatabaseSerializer(DateFilterSerializer):
             .last()
         )
 
-    def _gen_prospect(self, representation, instance):
-        # Remember to call _gen_prospect after representation has already been added with categories and incomes
-        actual_money = self._get_actual_money(instance)
-        precedent_money = self._get_precedent_actual_money(instance)
+    def _get_month_figures(self, instance):
+        return get_month_figures(
+            instance,
+            self.context["request"].min_date,
+            self.context["request"].max_date,
+        )
+
+    def _gen_prospect(self, representation, figures):
+        # All the figures of the month are fetched at once by _get_month_figures
+        actual_money = figures["actual_money"]
+        precedent_money = figures["precedent_money"]
 
         prospect = {"warn": None}
-        prospect["income"] = (
-            instance.cashes.filter(**self.gen_filters_for_month("reference_date"))
-            .filter(income=True)
-            .aggregate(models.Sum("value", default=0))["value__sum"]
-        )
+        prospect["income"] = figures["income"]
         prospect["actual_money"] = extract_value(actual_money) or Decimal(0)
-        prospect["expected_expenditure"] = (
-            instance.expenditures.filter(**self.gen_filters_for_month())
-            .filter(is_expected=True)
-            .aggregate(models.Sum("value", default=0))["value__sum"]
-        )
-        prospect["actual_expenditure"] = (
-            instance.expenditures.filter(**self.gen_filters_for_month())
-            .filter(is_expected=False)
-            .aggregate(models.Sum("value", default=0))["value__sum"]
-        )
+        prospect["expected_expenditure"] = figures["expected_expenditure"]
+        prospect["actual_expenditure"] = figures["actual_expenditure"]
 
         if not actual_money:
             prospect["warn"] = "Actual money for current month not registered yet"
@@ -83,7 +64,7 @@ class FullDatabaseSerializer(DateFilterSerializer):
             prospect["warn"] = "Previous month money not found"
         else:
             if not check_precedent_money_is_valid(
-                self._get_actual_money(instance), precedent_money, "reference_date"
+                actual_money, precedent_money, "reference_date"
             ):
                 prospect["warn"] = (
                     "Previous money registration is more than a month ago"
@@ -107,51 +88,76 @@ class FullDatabaseSerializer(DateFilterSerializer):
             )
         representation["prospect"] = prospect
 
-    def _gen_months_list(self, representation, instance):
-        incomes = (
-            instance.cashes.filter(income=True)
-            .annotate(my=models.functions.TruncMonth("reference_date"))
-            .order_by("my")
-            .values("my")
-            .annotate(value=models.Sum("value", default=0))
-            .values("my", "value")
-        )
-        current_moneys = (
-            instance.cashes.filter(income=False)
-            .annotate(my=models.functions.TruncMonth("reference_date"))
-            .order_by("my")
-        )
-        subquery = (
-            current_moneys.values("my")
-            .annotate(latest=models.Max("reference_date"))
-            .filter(pk=models.OuterRef("pk"))
-            .values("latest")
-        )
-
-        current_moneys = (
-            current_moneys.annotate(latest=models.Subquery(subquery))
-            .values("my")
-            .annotate(
-                latest_value=models.Sum(
-                    "value",
-                    default=0,
-                    filter=models.Q(reference_date=models.F("latest")),
+    def _gen_months_range(self):
+        """
+        Limits of months_list, from monthsFrom, monthsTo (inclusive, mm-yyyy) and monthsLimit
+        query parameters. Returns gte, lt and limit, each of them can be None.
+        """
+        params = getattr(self.context["request"], "params", {})
+        gte = lt = limit = None
+        try:
+            if "monthsFrom" in params:
+                gte = parse_month(params["monthsFrom"][0])
+            if "monthsTo" in params:
+                lt = parse_month(params["monthsTo"][0]) + relativedelta.relativedelta(
+                    months=1
                 )
+            if "monthsLimit" in params:
+                limit = int(params["monthsLimit"][0])
+                if limit < 1:
+                    raise ValueError(limit)
+        except ValueError:
+            raise serializers.ValidationError(
+                "monthsFrom and monthsTo must be formatted as mm-yyyy, monthsLimit must be a positive integer."
+            )
+        return gte, lt, limit
+
+    def _gen_months_list(self, representation, instance):
+        gte, lt, limit = self._gen_months_range()
+        month = models.functions.TruncMonth("reference_date")
+        cashes = instance.cashes.all()
+        if gte is not None:
+            cashes = cashes.filter(reference_date__gte=gte)
+        if lt is not None:
+            cashes = cashes.filter(reference_date__lt=lt)
+
+        # Latest registration of every month, for incomes and for actual moneys, with the
+        # sum of the incomes of the month.
+        latest = (
+            cashes.annotate(
+                my=month,
+                row_number=models.Window(
+                    models.functions.RowNumber(),
+                    partition_by=[month, "income"],
+                    order_by=[
+                        models.F("reference_date").desc(),
+                        models.F("id").desc(),
+                    ],
+                ),
+                month_income=models.Window(
+                    models.Sum("value"), partition_by=[month, "income"]
+                ),
             )
-            .values("my", "latest_value")
+            .filter(row_number=1)
+            .order_by("-my")
+            .values("my", "income", "value", "month_income")
         )
+        if limit is not None:
+            # At most two rows per month
+            latest = latest[: 2 * limit]
+
         months_available = set()
         incomes_dict = {}
         current_moneys_dict = {}
 
-        for i in incomes:
-            months_available.add(i["my"])
-            incomes_dict[i["my"].strftime("%m-%Y")] = i["value"]
-        for i in current_moneys:
+        for i in latest:
             months_available.add(i["my"])
-            current_moneys_dict[i["my"].strftime("%m-%Y")] = i["latest_value"]
+            if i["income"]:
+                incomes_dict[i["my"].strftime("%m-%Y")] = i["month_income"]
+            else:
+                current_moneys_dict[i["my"].strftime("%m-%Y")] = i["value"]
 
-        months_available = sorted(months_available, reverse=True)
+        months_available = sorted(months_available, reverse=True)[:limit]
 
         months_list = []
         current_month = self.gen_current_month()
@@ -160,15 +166,12 @@ class FullDatabaseSerializer(DateFilterSerializer):
             working_month = dt.strftime("%m-%Y")
 
             if i == len(months_available) - 1:
-                prev_month_actual_money = getattr(
-                    (
-                        pmam := self._get_precedent_actual_money_for_month(
-                            instance, lt=dt
-                        )
-                    ),
-                    "value",
-                    Decimal(0),
-                )
+                if gte is None and limit is None:
+                    # The whole history is listed, nothing can precede the oldest month
+                    pmam = None
+                else:
+                    pmam = self._get_precedent_actual_money_for_month(instance, lt=dt)
+                prev_month_actual_money = getattr(pmam, "value", Decimal(0))
                 prev_month_available = bool(pmam)
             else:
 
@@ -223,24 +226,29 @@ class FullDatabaseSerializer(DateFilterSerializer):
             "end": max_dt.strftime("%m-%Y"),
         }
 
+    def _gen_section(self, generate, instance):
+        section = {}
+        generate(section, instance)
+        return section
+
     def to_representation(self, instance):
         representation = super().to_representation(instance)
 
-        representation["incomes"] = serializers.PrimaryKeyRelatedField(
-            many=True, read_only=True
-        ).to_representation(
-            instance.cashes.filter(
-                **self.gen_filters_for_month("reference_date")
-            ).filter(income=True)
+        # Independent groups of queries, concurrent if enabled (see run_sections)
+        figures, months_list, time_boundaries = run_sections(
+            [
+                lambda: self._get_month_figures(instance),
+                lambda: self._gen_section(self._gen_months_list, instance),
+                lambda: self._gen_section(self._gen_time_boundaries, instance),
+            ]
         )
 
-        representation["actual_money"] = getattr(
-            self._get_actual_money(instance), "id", None
-        )
+        representation["incomes"] = figures["incomes"]
+        representation["actual_money"] = getattr(figures["actual_money"], "id", None)
 
-        self._gen_prospect(representation, instance)
-        self._gen_months_list(representation, instance)
-        self._gen_time_boundaries(representation, instance)
+        self._gen_prospect(representation, figures)
+        representation.update(months_list)
+        representation.update(time_boundaries)
         return representation
 
     def create(self, validated_data):
@@ -252,7 +260,96 @@ class FullDatabaseSerializer(DateFilterSerializer):
 class GraphDatabaseSerializer(FullDatabaseSerializer, DateFilterSerializer):
     categories = GraphsCategorySerializer(read_only=True, many=True)
 
+    def _gen_categories_summary(self, instance):
+        # Month totals of every category with a single grouped query, read by GraphsCategorySerializer
+        self.context["categories_summary"] = get_categories_summary(
+            self.gen_summary_month(), db=instance
+        )
+
     def to_representation(self, instance):
+        self._gen_categories_summary(instance)
         representation = super(DateFilterSerializer, self).to_representation(instance)
 
         return representation
+
+
+class TimeSeriesDatabaseSerializer(DateFilterSerializer):
+    # Longest series a request may ask for
+    max_months = 120
+
+    class Meta:
+        model = Database
+        fields = ["id", "name"]
+
+    def _gen_range(self):
+        """
+        First and last month (inclusive) of the series, from the from and to (mm-yyyy) query parameters,
+        and its number of months. Defaults to the year ending with the requested month.
+        """
+        params = getattr(self.context["request"], "params", {})
+        try:
+            last = (
+                summary_month(parse_month(params["to"][0]))
+                if "to" in params
+                else self.gen_summary_month()
+            )
+            first = (
+                summary_month(parse_month(params["from"][0]))
+                if "from" in params
+                else last - relativedelta.relativedelta(months=11)
+            )
+        except (ValueError, OverflowError):
+            raise serializers.ValidationError(
+                "from and to must be formatted as mm-yyyy."
+            )
+        if first > last:
+            raise serializers.ValidationError("from must not follow to.")
+        count = (last.year - first.year) * 12 + last.month - first.month + 1
+        if count > self.max_months:
+            raise serializers.ValidationError(
+                f"The series must not span more than {self.max_months} months."
+            )
+        return first, last, count
+
+    def to_representation(self, instance):
+        representation = super().to_representation(instance)
+        first, last, count = self._gen_range()
+
+        months = {}
+        # Counted, the month after last may not exist (12-9999)
+        for i in range(count):
+            month = first + relativedelta.relativedelta(months=i)
+            months[month] = {
+                "month": month.strftime("%m-%Y"),
+                "income": Decimal(0),
+                "current_money": None,
+                "expected_expenditure": Decimal(0),
+                "actual_expenditure": Decimal(0),
+                "categories": [],
+            }
+
+        # Every figure of the range is already bucketed by month in MonthlySummary
+        for summary in MonthlySummary.objects.filter(
+            db=instance, month__gte=first, month__lte=last
+        ).order_by("month", "category"):
+            element = months[summary.month]
+            if summary.category_id is None:
+                element["income"] = summary.income
+                element["current_money"] = summary.cash_value
+            else:
+                element["expected_expenditure"] += summary.expected_expenditure
+                element["actual_expenditure"] += summary.actual_expenditure
+                element["categories"].append(
+                    {
+                        "id": summary.category_id,
+                        "expected_expenditure": summary.expected_expenditure,
+                        "actual_expenditure": summary.actual_expenditure,
+                        "delta": summary.expected_expenditure
+                        - summary.actual_expenditure,
+                    }
+                )
+
+        representation["from"] = first.strftime("%m-%Y")
+        representation["to"] = last.strftime("%m-%Y")
+        representation["months"] = list(months.values())
+        return representation
@@ -1,20 +1,58 @@
-from decimal import Decimal
-from django.db.models import Sum
 from django.core.exceptions import ValidationError
 from rest_framework import serializers
 from django.utils import timezone
-from main.models import Expenditure
+from main.models import Category, Expenditure
 
 from .DateFilterSerializer import DateFilterSerializer
-from .DBRelatedBaseSerializer import DBRelatedBaseSerializer
+from ..permissions import get_db_ids
+from .DBRelatedBaseSerializer import (
+    BulkListSerializer,
+    DBRelatedBaseSerializer,
+    PrefetchedPrimaryKeyRelatedField,
+)
+
+
+class ExpenditureListSerializer(BulkListSerializer):
+    """
+    Creates and updates many expenditures at once: the referenced categories and expected
+    expenditures are fetched with one query each and the rows are written with a single
+    bulk_create or bulk_update.
+    """
+
+    prefetch_querysets = {
+        'category': Category.objects.select_related('db'),
+        'expected_expenditure': Expenditure.objects.filter(
+            is_expected=True).select_related('category__db'),
+    }
+    derived_fields = {
+        'category': ['db'],
+        'is_expected': ['expected_expenditure'],
+    }
+
+    def get_prefetch_querysets(self):
+        # Rows may only reference the categories and expected expenditures of the databases
+        # of the user, the database of a row is the one of its category
+        db_ids = get_db_ids(self.context['request'])
+        return {
+            name: queryset.filter(db__in=db_ids)
+            for name, queryset in self.prefetch_querysets.items()
+        }
+
+    def prepare(self, instance):
+        instance.fill_derived_fields()
+
+    def get_result_queryset(self):
+        # To render them with their prospect
+        return Expenditure.objects.with_prospect()
 
 
 class ExpenditureSerializer(DateFilterSerializer, DBRelatedBaseSerializer):
-    expected_expenditure = serializers.PrimaryKeyRelatedField(
+    expected_expenditure = PrefetchedPrimaryKeyRelatedField(
         required=False,
         allow_null=True,
         queryset=Expenditure.objects.filter(is_expected=True),
     )
+    category = PrefetchedPrimaryKeyRelatedField(queryset=Category.objects.all())
     actual_expenditures = serializers.PrimaryKeyRelatedField(
         read_only=True, many=True, allow_null=True
     )
@@ -37,6 +75,7 @@ class ExpenditureSerializer(DateFilterSerializer, DBRelatedBaseSerializer):
             'db',
             'actual_expenditures',
         ]
+        list_serializer_class = ExpenditureListSerializer
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
@@ -45,23 +84,20 @@ class ExpenditureSerializer(DateFilterSerializer, DBRelatedBaseSerializer):
         if representation['is_expected']:
             representation.pop('expected_expenditure')
 
-            prospect['actual'] = instance.actual_expenditures.all().aggregate(
-                Sum('value')
-            )['value__sum'] or Decimal(0)
+            prospect['actual'] = instance.actual_total
             prospect['expected'] = representation['value']
             prospect['delta'] = instance.value - prospect['actual']
 
         else:
             representation.pop('actual_expenditures')
 
-            if instance.expected_expenditure:
-                prospect[
-                    'actual'
-                ] = instance.expected_expenditure.actual_expenditures.all().aggregate(
-                    Sum('value')
-                )[
-                    'value__sum'
-                ]
+            if hasattr(instance, 'prospect_actual') and instance.expected_expenditure_id:
+                # Annotated by ExpenditureQuerySet.with_prospect
+                prospect['actual'] = instance.prospect_actual
+                prospect['expected'] = instance.prospect_expected
+                prospect['delta'] = prospect['expected'] - prospect['actual']
+            elif instance.expected_expenditure:
+                prospect['actual'] = instance.expected_expenditure.actual_total
                 prospect['expected'] = instance.expected_expenditure.value
                 prospect['delta'] = prospect['expected'] - prospect['actual']
             else:
@@ -79,6 +115,7 @@ class ExpenditureSerializer(DateFilterSerializer, DBRelatedBaseSerializer):
                 'Expenditure cannot be expected and have expected_expenditure at the same time.'
             )
         if attrs.get('expected_expenditure', None):
-            if attrs['expected_expenditure'].category.pk != attrs.get('category', None):
-                attrs['category'] = attrs['expected_expenditure'].category
+            expected_expenditure = attrs['expected_expenditure']
+            if expected_expenditure.category_id != getattr(attrs.get('category', None), 'pk', None):
+                attrs['category'] = expected_expenditure.category
         return super().validate(attrs)
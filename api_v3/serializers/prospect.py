@@ -0,0 +1,131 @@
+from decimal import Decimal
+from typing import NamedTuple, Optional
+
+from django.db import models
+from main.models import Cash, Database, MonthlySummary, summary_month
+
+
+class MoneyRegistration(NamedTuple):
+    id: Optional[int]
+    value: Decimal
+    reference_date: object
+
+
+class IdList(models.Aggregate):
+    """Comma separated list of ids, aggregated in the database."""
+
+    function = "GROUP_CONCAT"
+    output_field = models.TextField()
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler,
+            connection,
+            function="STRING_AGG",
+            template="%(function)s(CAST(%(expressions)s AS text), ',')",
+            **extra_context,
+        )
+
+
+def _decimal_subquery(queryset):
+    return models.Subquery(
+        queryset, output_field=models.DecimalField(max_digits=13, decimal_places=2)
+    )
+
+
+def get_month_figures(instance, min_date, max_date):
+    """
+    Fetch every figure of the month needed by FullDatabaseSerializer in a single query.
+    Sums and money registrations are read from MonthlySummary.
+    Returns a dict with income, expected_expenditure, actual_expenditure, incomes (ids),
+    actual_money and precedent_money (MoneyRegistration or None).
+    """
+    month = summary_month(min_date)
+    month_summaries = (
+        MonthlySummary.objects.filter(db=models.OuterRef("pk"), month=month)
+        .order_by()
+        .values("db")
+    )
+    db_summary = MonthlySummary.objects.filter(
+        db=models.OuterRef("pk"), month=month, category=None
+    )
+    precedent_summary = MonthlySummary.objects.filter(
+        db=models.OuterRef("pk"),
+        month__lt=month,
+        category=None,
+        cash__isnull=False,
+    ).order_by("-month")
+    month_incomes = (
+        Cash.objects.filter(
+            db=models.OuterRef("pk"),
+            reference_date__gte=min_date,
+            reference_date__lt=max_date,
+            income=True,
+        )
+        .order_by()
+        .values("db")
+    )
+
+    row = (
+        Database.objects.filter(pk=instance.pk)
+        .annotate(
+            income=models.Subquery(db_summary.values("income")[:1]),
+            incomes=models.Subquery(
+                month_incomes.annotate(ids=IdList("id")).values("ids"),
+                output_field=models.TextField(),
+            ),
+            expected_expenditure=_decimal_subquery(
+                month_summaries.annotate(
+                    total=models.Sum("expected_expenditure")
+                ).values("total")
+            ),
+            actual_expenditure=_decimal_subquery(
+                month_summaries.annotate(total=models.Sum("actual_expenditure")).values(
+                    "total"
+                )
+            ),
+            actual_money_id=models.Subquery(db_summary.values("cash")[:1]),
+            actual_money_value=models.Subquery(db_summary.values("cash_value")[:1]),
+            actual_money_date=models.Subquery(
+                db_summary.values("cash__reference_date")[:1]
+            ),
+            precedent_money_id=models.Subquery(precedent_summary.values("cash")[:1]),
+            precedent_money_value=models.Subquery(
+                precedent_summary.values("cash_value")[:1]
+            ),
+            precedent_money_date=models.Subquery(
+                precedent_summary.values("cash__reference_date")[:1]
+            ),
+        )
+        .values(
+            "income",
+            "incomes",
+            "expected_expenditure",
+            "actual_expenditure",
+            "actual_money_id",
+            "actual_money_value",
+            "actual_money_date",
+            "precedent_money_id",
+            "precedent_money_value",
+            "precedent_money_date",
+        )
+        .get()
+    )
+
+    def money(prefix):
+        if row[f"{prefix}_id"] is None:
+            return None
+        return MoneyRegistration(
+            id=row[f"{prefix}_id"],
+            value=row[f"{prefix}_value"],
+            reference_date=row[f"{prefix}_date"],
+        )
+
+    return {
+        "income": row["income"] or Decimal(0),
+        "incomes": sorted(int(i) for i in (row["incomes"] or "").split(",") if i),
+        "expected_expenditure": row["expected_expenditure"] or Decimal(0),
+        "actual_expenditure": row["actual_expenditure"] or Decimal(0),
+        "actual_money": money("actual_money"),
+        "precedent_money": money("precedent_money"),
+    }
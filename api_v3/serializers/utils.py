@@ -1,4 +1,6 @@
+from datetime import datetime
 from dateutil import relativedelta
+from django.utils import timezone
 
 
 class DummyRequest:
@@ -10,6 +12,12 @@ def extract_month(date):
     return f'{date.month} - {date.year}'
 
 
+def parse_month(value):
+    """Parse a mm-yyyy string into the aware datetime of the beginning of the month."""
+    month, year = [int(x.strip()) for x in value.split('-')[:2]]
+    return timezone.make_aware(datetime(year, month, 1))
+
+
 def extract_value(obj):
     k = 'value'
     if hasattr(obj, 'get'):
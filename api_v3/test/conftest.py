@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import pytest
+from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory
+
+from main.models import Cash, Category, Expenditure
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+
+@pytest.fixture
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@pytest.fixture
+def database(database, user, aware):
+    """The database of the user, with some history between 11-2024 and 01-2025."""
+    rent, food, _ = [
+        Category.objects.create(name=name, db=database)
+        for name in ["rent", "food", "fun"]
+    ]
+    Cash.objects.create(value=1000, reference_date=aware(2024, 11, 30), db=database)
+    Cash.objects.create(value=1500, reference_date=aware(2024, 12, 28), db=database)
+    Cash.objects.create(value=1400, reference_date=aware(2025, 1, 10), db=database)
+    Cash.objects.create(value=1700, reference_date=aware(2025, 1, 31), db=database)
+    for day, value in [(5, 2000), (20, 300)]:
+        Cash.objects.create(
+            value=value, reference_date=aware(2025, 1, day), income=True, db=database
+        )
+    expected = Expenditure.objects.create(
+        name="rent",
+        value=800,
+        date=aware(2025, 1, 1),
+        is_expected=True,
+        category=rent,
+        user=user,
+    )
+    Expenditure.objects.create(
+        name="rent paid",
+        value=790,
+        date=aware(2025, 1, 3),
+        category=rent,
+        user=user,
+        expected_expenditure=expected,
+    )
+    Expenditure.objects.create(
+        name="groceries",
+        value="50.50",
+        date=aware(2025, 1, 13),
+        category=food,
+        user=user,
+    )
+    Expenditure.objects.create(
+        name="groceries", value=40, date=aware(2024, 12, 13), category=food, user=user
+    )
+    return database
+
+
+@pytest.fixture
+def month_request(user):
+    """Build a request for the given month as ParsedRequest would."""
+
+    def build(month, year):
+        request = APIRequestFactory().get("/")
+        request.user = user
+        request.min_date = timezone.make_aware(datetime(year, month, 1))
+        request.max_date = request.min_date + relativedelta(months=1)
+        return request
+
+    return build
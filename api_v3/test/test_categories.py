@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from django.utils import timezone
+
+from main.models import Category, Expenditure
+
+
+def test_categories_list(database, api_client):
+    response = api_client.get(f"/v3/categories/?db={database.id}", HTTP_MONTH="01-2025")
+    assert response.status_code == 200
+    categories = {c["name"]: c for c in response.json()}
+    rent = categories["rent"]
+    assert rent["expected_expenditures"] == list(
+        database.expenditures.filter(name="rent").values_list("id", flat=True)
+    )
+    assert rent["actual_expenditures"] == list(
+        database.expenditures.filter(name="rent paid").values_list("id", flat=True)
+    )
+    assert rent["prospect"] == {
+        "expected_expenditure": 800,
+        "actual_expenditure": 790,
+        "delta": 10,
+    }
+    assert categories["fun"]["actual_expenditures"] == []
+
+    # A single category is rendered the same way
+    response = api_client.get(f"/v3/categories/{rent['id']}/", HTTP_MONTH="01-2025")
+    assert response.json() == rent
+
+
+def test_malformed_month(database, api_client):
+    for month in ["13-2025", "january", "01"]:
+        response = api_client.get(f"/v3/categories/?db={database.id}", HTTP_MONTH=month)
+        assert response.status_code == 400
+        assert "month" in response.json()
+
+    response = api_client.get(f"/v3/categories/?db={database.id}&month=1-2025")
+    assert response.status_code == 200
+
+
+def test_categories_list_queries_do_not_depend_on_categories(
+    database, user, api_client, count_queries
+):
+    url = f"/v3/categories/?db={database.id}"
+    queries = count_queries(api_client, url, HTTP_MONTH="01-2025")
+    for i in range(40):
+        category = Category.objects.create(name=f"category {i}", db=database)
+        for is_expected in [True, False]:
+            Expenditure.objects.create(
+                name="expense",
+                value=i,
+                is_expected=is_expected,
+                date=timezone.make_aware(datetime(2025, 1, 2)),
+                category=category,
+                user=user,
+            )
+    assert count_queries(api_client, url, HTTP_MONTH="01-2025") == queries
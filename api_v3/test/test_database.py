@@ -0,0 +1,478 @@
+import csv
+import json
+import pstats
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api_v3 import timing
+from api_v3.serializers import CategorySerializer, FullDatabaseSerializer
+from main.models import Category, Database, Expenditure
+
+
+def test_month_figures_are_fetched_in_one_query(
+    database, month_request, django_assert_num_queries
+):
+    serializer = FullDatabaseSerializer(context={"request": month_request(1, 2025)})
+    with django_assert_num_queries(1):
+        figures = serializer._get_month_figures(database)
+
+    assert figures["income"] == Decimal(2300)
+    assert figures["expected_expenditure"] == Decimal(800)
+    assert figures["actual_expenditure"] == Decimal("840.50")
+    assert figures["actual_money"].value == Decimal(1700)
+    assert figures["precedent_money"].value == Decimal(1500)
+    assert len(figures["incomes"]) == 2
+
+
+def test_prospect(database, month_request):
+    serializer = FullDatabaseSerializer(context={"request": month_request(1, 2025)})
+    representation = serializer.to_representation(database)
+
+    prospect = representation["prospect"]
+    assert prospect["warn"] is None
+    assert prospect["actual_saving"] == Decimal(200)
+    assert prospect["expected_saving"] == Decimal("1459.50")
+    assert prospect["delta_saving"] == Decimal("-1259.50")
+    assert representation["actual_money"] == database.cashes.get(value=1700).id
+    assert representation["incomes"] == sorted(
+        database.cashes.filter(income=True).values_list("id", flat=True)
+    )
+
+
+def test_prospect_without_money(database, month_request):
+    serializer = FullDatabaseSerializer(context={"request": month_request(2, 2025)})
+    representation = serializer.to_representation(database)
+
+    prospect = representation["prospect"]
+    assert prospect["warn"] == "Actual money for current month not registered yet"
+    assert prospect["income"] == Decimal(0)
+    assert prospect["actual_saving"] is None
+    assert representation["actual_money"] is None
+    assert representation["incomes"] == []
+
+
+def test_months_list_uses_latest_money(database, month_request):
+    serializer = FullDatabaseSerializer(context={"request": month_request(1, 2025)})
+    representation = serializer.to_representation(database)
+
+    months = {m["month"]: m for m in representation["months_list"]}
+    assert list(months) == ["01-2025", "12-2024", "11-2024"]
+    assert months["01-2025"]["current_money"] == Decimal(1700)
+    assert months["01-2025"]["income"] == Decimal(2300)
+    assert months["01-2025"]["previous_month_actual_money"] == Decimal(1500)
+    assert months["11-2024"]["warn"] == "This month has no actual money registration"
+
+
+def test_months_list_range(database, month_request, django_assert_num_queries):
+    request = month_request(1, 2025)
+    request.params = {"monthsFrom": ["12-2024"], "monthsTo": ["12-2024"]}
+    serializer = FullDatabaseSerializer(context={"request": request})
+    representation = {}
+    with django_assert_num_queries(2):
+        serializer._gen_months_list(representation, database)
+
+    (month,) = representation["months_list"]
+    assert month["month"] == "12-2024"
+    assert month["current_money"] == Decimal(1500)
+    assert month["previous_month_actual_money"] == Decimal(1000)
+    assert month["warn"] is None
+
+
+def _query_plans(render):
+    """EXPLAIN the queries on cashes and expenditures executed by render."""
+    executed = []
+
+    def record(execute, sql, params, many, context):
+        executed.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(record):
+        render()
+
+    explain = {
+        "sqlite": "EXPLAIN QUERY PLAN ",
+        "postgresql": "EXPLAIN ",
+    }[connection.vendor]
+    plans = []
+    with connection.cursor() as cursor:
+        for sql, params in executed:
+            if '"main_cash"' in sql or '"main_expenditure"' in sql:
+                cursor.execute(explain + sql, params)
+                plans.append("\n".join(str(row[-1]) for row in cursor.fetchall()))
+    return plans
+
+
+def test_month_queries_use_indexes(database, month_request):
+    request = month_request(1, 2025)
+    request.params = {"monthsFrom": ["12-2024"]}
+    serializer = FullDatabaseSerializer(context={"request": request})
+    plans = _query_plans(lambda: serializer.to_representation(database))
+    # Incomes of the month, precedent actual money and time boundaries
+    for index in [
+        "cash_income_date_idx",
+        "cash_money_date_idx",
+        "expenditure_db_date_idx",
+    ]:
+        assert any(index in plan for plan in plans), index
+
+    category = database.categories.get(name="rent")
+    serializer = CategorySerializer(category, context={"request": request})
+    plans = _query_plans(lambda: serializer.data)
+    assert plans
+    assert all("expenditure_category_date_idx" in plan for plan in plans)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_sections(database, month_request, settings, monkeypatch):
+    request = month_request(1, 2025)
+    expected = FullDatabaseSerializer(context={"request": request}).to_representation(
+        database
+    )
+
+    threads = set()
+    gen_time_boundaries = FullDatabaseSerializer._gen_time_boundaries
+
+    def record_thread(self, representation, instance):
+        threads.add(threading.current_thread().name)
+        gen_time_boundaries(self, representation, instance)
+
+    monkeypatch.setattr(FullDatabaseSerializer, "_gen_time_boundaries", record_thread)
+    settings.API_SECTION_WORKERS = 2
+    representation = FullDatabaseSerializer(
+        context={"request": request}
+    ).to_representation(database)
+    assert representation == expected
+    assert list(representation) == list(expected)
+    assert all(name.startswith("api-sections") for name in threads)
+
+
+def test_months_list_limit(database, api_client):
+    response = api_client.get(f"/v3/dbs/{database.id}/?monthsLimit=2")
+    assert response.status_code == 200
+    assert [m["month"] for m in response.json()["months_list"]] == [
+        "01-2025",
+        "12-2024",
+    ]
+
+    response = api_client.get(f"/v3/dbs/{database.id}/?monthsFrom=2025")
+    assert response.status_code == 400
+
+
+def test_graph(database, api_client):
+    response = api_client.get(f"/v3/dbs/{database.id}/graph/", HTTP_MONTH="01-2025")
+    assert response.status_code == 200
+    prospects = {c["name"]: c["prospect"] for c in response.json()["categories"]}
+    assert prospects["rent"] == {
+        "expected_expenditure": 800,
+        "actual_expenditure": 790,
+        "delta": 10,
+    }
+    assert prospects["food"]["actual_expenditure"] == 50.5
+    assert prospects["fun"]["delta"] == 0
+
+
+def test_graph_queries_do_not_depend_on_categories(
+    database, user, api_client, count_queries
+):
+    url = f"/v3/dbs/{database.id}/graph/"
+    queries = count_queries(api_client, url, HTTP_MONTH="01-2025")
+    for i in range(40):
+        category = Category.objects.create(name=f"category {i}", db=database)
+        Expenditure.objects.create(
+            name="expense",
+            value=i,
+            date=timezone.make_aware(datetime(2025, 1, 2)),
+            category=category,
+            user=user,
+        )
+    assert count_queries(api_client, url, HTTP_MONTH="01-2025") == queries
+
+
+def test_timeseries(database, api_client, django_assert_max_num_queries):
+    with django_assert_max_num_queries(5):
+        response = api_client.get(
+            f"/v3/dbs/{database.id}/timeseries/?from=11-2024&to=02-2025"
+        )
+    assert response.status_code == 200
+    data = response.json()
+    assert [m["month"] for m in data["months"]] == [
+        "11-2024",
+        "12-2024",
+        "01-2025",
+        "02-2025",
+    ]
+    november, december, january, february = data["months"]
+    assert november["current_money"] == 1000
+    assert december["actual_expenditure"] == 40
+    assert january["income"] == 2300
+    assert january["current_money"] == 1700
+    assert january["expected_expenditure"] == 800
+    assert january["actual_expenditure"] == 840.5
+    rent = database.categories.get(name="rent")
+    assert {
+        "id": rent.id,
+        "expected_expenditure": 800,
+        "actual_expenditure": 790,
+        "delta": 10,
+    } in january["categories"]
+    assert february["current_money"] is None
+    assert february["categories"] == []
+
+
+def test_timeseries_defaults_to_the_last_year(database, api_client):
+    response = api_client.get(
+        f"/v3/dbs/{database.id}/timeseries/", HTTP_MONTH="01-2025"
+    )
+    data = response.json()
+    assert (data["from"], data["to"]) == ("02-2024", "01-2025")
+    assert len(data["months"]) == 12
+
+    for query in [
+        "from=02-2025&to=01-2025",
+        "from=01-1000&to=12-9999",
+        "from=01-2015&to=01-2025",
+        "to=01-0001",
+        "from=13-2024",
+    ]:
+        response = api_client.get(f"/v3/dbs/{database.id}/timeseries/?{query}")
+        assert response.status_code == 400, query
+
+    response = api_client.get(
+        f"/v3/dbs/{database.id}/timeseries/?from=01-9990&to=12-9999"
+    )
+    assert response.status_code == 200
+    assert response.json()["months"][-1]["month"] == "12-9999"
+
+
+def test_export(database, user, api_client):
+    response = api_client.get(f"/v3/dbs/{database.id}/export/")
+    assert response.status_code == 200
+    assert response.streaming
+    assert response["Content-Type"] == "application/jsonl; charset=utf-8"
+    rows = [
+        json.loads(line)
+        for line in b"".join(response.streaming_content).decode().splitlines()
+    ]
+    assert [row["type"] for row in rows] == ["category"] * 3 + ["cash"] * 6 + [
+        "expenditure"
+    ] * 4
+    rent = database.expenditures.get(name="rent")
+    assert rows[-4] == {
+        "type": "expenditure",
+        "id": rent.id,
+        "name": "rent",
+        "value": 800.0,
+        "date": "2025-01-01T12:00:00+01:00",
+        "is_expected": True,
+        "category": rent.category_id,
+        "expected_expenditure": None,
+        "user": user.id,
+    }
+
+    response = api_client.get(
+        f"/v3/dbs/{database.id}/export/?format=csv&from=2025-01-01&to=2025-01-15"
+    )
+    assert response.status_code == 200
+    assert response["Content-Type"] == "text/csv; charset=utf-8"
+    rows = list(
+        csv.DictReader(b"".join(response.streaming_content).decode().splitlines())
+    )
+    assert [(row["type"], row["name"]) for row in rows] == [
+        ("category", "rent"),
+        ("category", "food"),
+        ("category", "fun"),
+        ("cash", ""),
+        ("cash", ""),
+        ("expenditure", "rent"),
+        ("expenditure", "rent paid"),
+        ("expenditure", "groceries"),
+    ]
+
+    response = api_client.get(f"/v3/dbs/{database.id}/export/?format=csv&from=nope")
+    assert response.status_code == 400
+    other = Database.objects.create(name="other")
+    response = api_client.get(f"/v3/dbs/{other.id}/export/")
+    assert response.status_code == 404
+
+
+def test_membership_is_cached(database, user, api_client):
+    url = f"/v3/categories/?db={database.id}"
+    assert api_client.get(url).status_code == 200
+    with CaptureQueriesContext(connection) as context:
+        assert api_client.get(url).status_code == 200
+    assert not any(
+        "main_database_users" in query["sql"] for query in context.captured_queries
+    )
+    # Nor the database itself, lists are filtered by its id
+    for path in [url, f"/v3/cash/?db={database.id}"]:
+        with CaptureQueriesContext(connection) as context:
+            assert api_client.get(path).status_code == 200
+        assert not any(
+            'FROM "main_database"' in query["sql"] for query in context.captured_queries
+        )
+
+    database.users.remove(user)
+    assert api_client.get(url).status_code == 404
+    user.dbs.add(database)
+    assert api_client.get(url).status_code == 200
+    database.users.clear()
+    assert api_client.get(url).status_code == 404
+
+
+def test_etag(database, user, api_client):
+    for url in [
+        f"/v3/dbs/{database.id}/",
+        f"/v3/dbs/{database.id}/graph/",
+        f"/v3/categories/?db={database.id}",
+        f"/v3/expenditures/?db={database.id}",
+    ]:
+        response = api_client.get(url, HTTP_MONTH="01-2025")
+        assert response.status_code == 200
+        etag = response["ETag"]
+
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.get(
+                url, HTTP_MONTH="01-2025", HTTP_IF_NONE_MATCH=etag
+            )
+        assert response.status_code == 304
+        assert response["ETag"] == etag
+        assert not any(
+            "main_expenditure" in query["sql"] or "main_category" in query["sql"]
+            for query in context.captured_queries
+        )
+
+        # Other months have their own ETag
+        response = api_client.get(url, HTTP_MONTH="02-2025", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+
+        # Any change of the database changes the ETag
+        database.categories.first().save()
+        response = api_client.get(url, HTTP_MONTH="01-2025", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response["ETag"] != etag
+
+    # Responses not bound to one database have no ETag
+    assert "ETag" not in api_client.get("/v3/expenditures/search/?queryString=a")
+
+
+def test_response_cache(database, user, api_client, django_assert_num_queries):
+    for url in [f"/v3/dbs/{database.id}/", f"/v3/dbs/{database.id}/graph/"]:
+        response = api_client.get(url, HTTP_MONTH="01-2025")
+        assert response.status_code == 200
+        # Hits do not touch the ORM
+        with django_assert_num_queries(0):
+            cached = api_client.get(url, HTTP_MONTH="01-2025")
+        assert cached.json() == response.json()
+
+        Expenditure.objects.filter(name="groceries").update(value=1)
+        response = api_client.get(url, HTTP_MONTH="01-2025")
+        assert response.json() != cached.json()
+        Expenditure.objects.filter(name="groceries").update(value=40)
+
+
+def _server_timing(response):
+    metrics = {}
+    for metric in response["Server-Timing"].split(", "):
+        name, *params = metric.split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+def test_server_timing(database, api_client, settings, caplog):
+    url = f"/v3/dbs/{database.id}/"
+    response = api_client.get(url, HTTP_MONTH="01-2025")
+    assert not response.has_header("Server-Timing")
+
+    settings.API_TIMING = True
+    # Middlewares are loaded by the first request of a client
+    api_client = type(api_client)()
+    api_client.force_authenticate(database.users.get())
+    cache.clear()
+    with CaptureQueriesContext(connection) as queries:
+        response = api_client.get(url, HTTP_MONTH="01-2025")
+    metrics = _server_timing(response)
+    assert metrics["db"]["desc"] == f'"{len(queries)} queries"'
+    assert 0 < float(metrics["serializer"]["dur"]) <= float(metrics["total"]["dur"])
+    assert metrics["view"]["desc"] == '"DatabaseViewSet.retrieve"'
+    assert not caplog.records
+
+    settings.API_SLOW_REQUEST_QUERIES = 0
+    cache.clear()
+    response = api_client.get(f"/v3/categories/?db={database.id}", HTTP_MONTH="01-2025")
+    assert response.status_code == 200
+    [record] = caplog.records
+    assert record.name == "api_v3.timing"
+    assert record.slow_request["view"] == "CategoryViewSet.list"
+    assert record.slow_request["db"] == str(database.id)
+    assert record.slow_request["queries"] > 0
+
+
+def test_profile(database, user, api_client, settings, tmp_path, monkeypatch):
+    settings.API_PROFILE_DIR = str(tmp_path)
+    # As when serverTiming is not used, the queries are only recorded while profiling
+    monkeypatch.setattr(timing, "_enabled", False)
+    monkeypatch.setattr(connection, "execute_wrappers", [])
+    url = f"/v3/dbs/{database.id}/"
+    response = api_client.get(url, HTTP_MONTH="01-2025", HTTP_X_PROFILE="1")
+    assert response.status_code == 200
+    assert not response.has_header("X-Profile-Id")
+    assert not list(tmp_path.iterdir())
+
+    user.is_staff = True
+    user.save()
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    # The response is cached now, profiled requests skip the cache
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url, HTTP_MONTH="01-2025", HTTP_X_PROFILE="1")
+    assert response.status_code == 200
+    profile_id = response["X-Profile-Id"]
+
+    stats = pstats.Stats(str(tmp_path / f"{profile_id}.prof"))
+    assert any(function == "to_representation" for _, _, function in stats.stats.keys())
+    with open(tmp_path / f"{profile_id}.json") as f:
+        annotation = json.load(f)
+    assert annotation["path"] == url
+    # The queries of the authentication come before the profile
+    assert 0 < len(annotation["queries"]) < len(queries)
+    assert any("main_expenditure" in query["sql"] for query in annotation["queries"])
+    assert all("params" not in query for query in annotation["queries"])
+    assert connection.execute_wrappers == []
+
+    settings.API_PROFILE_KEEP = 2
+    for _ in range(3):
+        response = client.get(url, HTTP_MONTH="01-2025", HTTP_X_PROFILE="1")
+    assert (tmp_path / f"{response['X-Profile-Id']}.prof").exists()
+    assert len(list(tmp_path.glob("*.json"))) == len(list(tmp_path.glob("*.prof"))) == 2
+
+
+def test_profile_under_asgi(database, user, settings, tmp_path):
+    settings.API_PROFILE_DIR = str(tmp_path)
+    user.is_staff = True
+    user.save()
+    token = Token.objects.create(user=user)
+    response = async_to_sync(AsyncClient().get)(
+        f"/v3/dbs/{database.id}/",
+        headers={
+            "authorization": f"Token {token.key}",
+            "month": "01-2025",
+            "x-profile": "1",
+        },
+    )
+    assert response.status_code == 200
+    # The view runs in the profiled thread
+    stats = pstats.Stats(str(tmp_path / f"{response['X-Profile-Id']}.prof"))
+    assert any(function == "to_representation" for _, _, function in stats.stats.keys())
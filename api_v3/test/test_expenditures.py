@@ -0,0 +1,425 @@
+import json
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api_v3.serializers.expenditure import ExpenditureListSerializer
+from api_v3.views import StreamingListMixin
+from main.models import Cash, Category, Database, Expenditure
+
+
+def test_expenditures_prospect(database, api_client):
+    response = api_client.get(f"/v3/expenditures/?db={database.id}")
+    assert response.status_code == 200
+    expenditures = {e["name"]: e for e in response.json()}
+
+    expected = expenditures["rent"]
+    assert expected["actual_expenditures"] == [expenditures["rent paid"]["id"]]
+    assert expected["prospect"] == {"actual": 790, "expected": 800, "delta": 10}
+    assert expenditures["rent paid"]["prospect"] == expected["prospect"]
+    assert expenditures["groceries"]["prospect"]["expected"] is None
+
+    # Single objects and newly created ones are rendered the same way
+    response = api_client.get(f"/v3/expenditures/{expected['id']}/")
+    assert response.json() == expected
+
+
+def test_expenditures_queries_do_not_depend_on_expenditures(
+    database, user, api_client, count_queries
+):
+    urls = [
+        f"/v3/expenditures/?db={database.id}",
+        "/v3/expenditures/search/?queryString=rent",
+    ]
+    queries = [count_queries(api_client, url) for url in urls]
+    category = database.categories.get(name="rent")
+    date = timezone.make_aware(datetime(2025, 2, 1))
+    for i in range(20):
+        expected = Expenditure.objects.create(
+            name="rent",
+            value=100,
+            date=date,
+            is_expected=True,
+            category=category,
+            user=user,
+        )
+        Expenditure.objects.create(
+            name="rent paid",
+            value=i,
+            date=date,
+            category=category,
+            user=user,
+            expected_expenditure=expected,
+        )
+    assert [count_queries(api_client, url) for url in urls] == queries
+
+
+def test_created_expenditure_prospect(database, api_client):
+    rent = database.expenditures.get(name="rent")
+    response = api_client.post(
+        "/v3/expenditures/",
+        {
+            "name": "rent extra",
+            "value": 20,
+            "date": "2025-01-20T12:00:00+01:00",
+            "category": rent.category_id,
+            "expected_expenditure": rent.id,
+        },
+        format="json",
+        HTTP_DB=str(database.id),
+    )
+    assert response.status_code == 201, response.json()
+    assert response.json()["prospect"] == {
+        "actual": 810,
+        "expected": 800,
+        "delta": -10,
+    }
+
+
+def search_names(api_client, query_string, **params):
+    response = api_client.get(
+        "/v3/expenditures/search/", {"queryString": query_string, **params}
+    )
+    assert response.status_code == 200
+    return [e["name"] for e in response.json()]
+
+
+def test_search_expenditures(database, user, api_client):
+    category = database.categories.get(name="rent")
+    Expenditure.objects.create(
+        name="Caffè al bar",
+        value=2,
+        date=timezone.make_aware(datetime(2025, 1, 2)),
+        category=category,
+        user=user,
+    )
+
+    # Terms match the beginning of words, ignoring case and accents
+    assert sorted(search_names(api_client, "ren")) == ["rent", "rent paid"]
+    assert search_names(api_client, "PAI") == ["rent paid"]
+    assert search_names(api_client, "caffe") == ["Caffè al bar"]
+    assert search_names(api_client, "ent") == []
+    # Spaces match in AND, commas in OR
+    assert search_names(api_client, "rent pa") == ["rent paid"]
+    assert sorted(search_names(api_client, "paid, groc")) == [
+        "groceries",
+        "groceries",
+        "rent paid",
+    ]
+    # Punctuation is ignored
+    assert sorted(search_names(api_client, '"rent')) == ["rent", "rent paid"]
+
+    # The index follows updates, deletions and bulk creations
+    Expenditure.objects.filter(name="rent paid").update(name="house paid")
+    assert search_names(api_client, "house") == ["house paid"]
+    assert search_names(api_client, "rent") == ["rent"]
+    Expenditure.objects.filter(name="house paid").delete()
+    assert search_names(api_client, "house") == []
+    Expenditure.objects.bulk_create(
+        [
+            Expenditure(
+                name="house keys",
+                value=10,
+                date=timezone.make_aware(datetime(2025, 1, 3)),
+                category=category,
+                db=database,
+                user=user,
+            )
+        ]
+    )
+    assert search_names(api_client, "house") == ["house keys"]
+
+
+def test_search_expenditures_by_relevance(database, user, api_client):
+    category = database.categories.get(name="rent")
+    Expenditure.objects.create(
+        name="rent rent",
+        value=2,
+        date=timezone.make_aware(datetime(2024, 1, 1)),
+        category=category,
+        user=user,
+    )
+    names = search_names(api_client, "rent")
+    assert names[-1] == "rent rent"
+    assert search_names(api_client, "rent", ordering="relevance")[0] == "rent rent"
+
+
+def test_expenditures_cursor_pagination(database, user, api_client):
+    category = database.categories.get(name="rent")
+    # Rows sharing the same date are told apart by id
+    for i in range(12):
+        Expenditure.objects.create(
+            name=f"rent {i}",
+            value=i,
+            date=timezone.make_aware(datetime(2025, 1, 1 + i % 3)),
+            category=category,
+            user=user,
+        )
+    # Undated rows, that save() no longer creates, come last: enough of them for one
+    # to end a page
+    for i in range(6):
+        Expenditure.objects.create(
+            name=f"rent undated {i}", value=i, category=category, user=user
+        )
+    Expenditure.objects.filter(name__startswith="rent undated").update(date=None)
+
+    for url in [
+        f"/v3/expenditures/?db={database.id}",
+        "/v3/expenditures/search/?queryString=rent",
+        "/v3/expenditures/search/?queryString=rent&ordering=relevance",
+    ]:
+        unpaginated = api_client.get(url).json()
+        assert isinstance(unpaginated, list)
+
+        pages = []
+        queries = set()
+        next_url = f"{url}&pageSize=5"
+        while next_url:
+            with CaptureQueriesContext(connection) as context:
+                response = api_client.get(next_url)
+            assert response.status_code == 200
+            assert not any(
+                query["sql"].startswith(
+                    'SELECT COUNT(*) AS "__count" FROM "main_expenditure"'
+                )
+                for query in context.captured_queries
+            )
+            queries.add(len(context.captured_queries))
+            pages.append(response.json()["results"])
+            next_url = response.json()["next"]
+        # Deep pages cost as much as the first one
+        assert len(queries) == 1
+        assert all(len(page) == 5 for page in pages[:-1])
+        ids = [e["id"] for page in pages for e in page]
+        assert sorted(ids) == sorted(e["id"] for e in unpaginated)
+        assert any(page[-1]["date"] is None for page in pages[:-1])
+        if "relevance" not in url:
+            dates = [e["date"] for page in pages for e in page]
+            assert dates[-6:] == [None] * 6
+
+    response = api_client.get(f"/v3/expenditures/?db={database.id}&cursor=nope")
+    assert response.status_code == 404
+
+
+def test_expenditures_streaming(database, user, api_client, monkeypatch):
+    monkeypatch.setattr(StreamingListMixin, "stream_chunk_size", 2)
+    for url in [
+        f"/v3/expenditures/?db={database.id}",
+        "/v3/expenditures/search/?queryString=rent,groceries",
+        "/v3/expenditures/search/?queryString=nothing",
+    ]:
+        expected = api_client.get(url).json()
+        response = api_client.get(f"{url}&stream=true")
+        assert response.status_code == 200
+        assert response.streaming
+        assert response["Content-Type"] == "application/json"
+        chunks = list(response.streaming_content)
+        assert len(chunks) == 2 + (len(expected) + 1) // 2
+        assert json.loads(b"".join(chunks)) == expected
+
+
+def test_bulk_create_expenditures(database, api_client):
+    rent = database.expenditures.get(name="rent")
+    food = database.categories.get(name="food")
+
+    def post(count):
+        rows = [
+            {
+                "name": f"row {i}",
+                "value": 1,
+                "date": "2025-01-20T12:00:00+01:00",
+                "category": food.id,
+                "expected_expenditure": rent.id if i % 2 else None,
+            }
+            for i in range(count)
+        ]
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.post(
+                "/v3/expenditures/", rows, format="json", HTTP_DB=str(database.id)
+            )
+        assert response.status_code == 201, response.json()
+        return response.json(), len(context.captured_queries)
+
+    post(1)  # the membership of the user is cached by the first request
+    created, queries = post(4)
+    assert post(40)[1] == queries
+    assert [e["name"] for e in created] == ["row 0", "row 1", "row 2", "row 3"]
+    # Rows linked to an expected expenditure are moved to its category
+    assert [e["category"] for e in created] == [
+        food.id,
+        rent.category_id,
+        food.id,
+        rent.category_id,
+    ]
+    rent.refresh_from_db()
+    assert rent.actual_total == 790 + 22
+    assert created[-1]["prospect"] == {"actual": 790 + 2, "expected": 800, "delta": 8}
+
+    response = api_client.post(
+        "/v3/expenditures/",
+        [
+            {"name": "ok", "value": 1, "category": food.id},
+            {"name": "ko", "value": 1, "category": 0},
+        ],
+        format="json",
+        HTTP_DB=str(database.id),
+    )
+    assert response.status_code == 400
+    assert response.json()[0] == {"date": ["This field is required."]}
+    assert "category" in response.json()[1]
+
+
+def test_bulk_create_checks_databases(database, user, api_client):
+    other_user = User.objects.create_user("eve", "eve@example.com", "password")
+    other = Database.objects.create(name="other")
+    other.users.add(other_user)
+    category = Category.objects.create(name="secret", db=other)
+    budget = Expenditure.objects.create(
+        name="secret budget",
+        value=100,
+        date=timezone.make_aware(datetime(2025, 1, 1)),
+        is_expected=True,
+        category=category,
+        user=other_user,
+    )
+    food = database.categories.get(name="food")
+
+    for row in [
+        {"category": category.id},
+        {"category": food.id, "expected_expenditure": budget.id},
+    ]:
+        response = api_client.post(
+            "/v3/expenditures/",
+            [{"name": "row", "value": 1, "date": "2025-01-20T12:00:00+01:00", **row}],
+            format="json",
+            HTTP_DB=str(database.id),
+        )
+        assert response.status_code == 400
+        assert list(row)[-1] in response.json()[0]
+    assert not Expenditure.objects.filter(name="row").exists()
+
+
+def test_bulk_update_and_delete_expenditures(database, user, api_client):
+    food = database.categories.get(name="food")
+    fun = database.categories.get(name="fun")
+    rent = database.expenditures.get(name="rent")
+    for i in range(10):
+        Expenditure.objects.create(
+            name=f"row {i}",
+            value=1,
+            date=timezone.make_aware(datetime(2025, 1, 20)),
+            category=food,
+            user=user,
+        )
+    rows = list(database.expenditures.filter(name__startswith="row"))
+
+    def patch(rows):
+        with CaptureQueriesContext(connection) as context:
+            response = api_client.patch(
+                "/v3/expenditures/",
+                [
+                    {"id": e.id, "category": fun.id, "expected_expenditure": None}
+                    for e in rows
+                ],
+                format="json",
+            )
+        assert response.status_code == 200, response.json()
+        return response.json(), len(context.captured_queries)
+
+    patch(rows[:1])
+    updated, queries = patch(rows[1:3])
+    assert patch(rows[3:])[1] == queries
+    assert [e["id"] for e in updated] == [e.id for e in rows[1:3]]
+    assert {e["category"] for e in updated} == {fun.id}
+    assert fun.monthly_summaries.get().actual_expenditure == 10
+
+    response = api_client.patch(
+        "/v3/expenditures/",
+        [{"id": rows[0].id, "expected_expenditure": rent.id}],
+        format="json",
+    )
+    assert response.json()[0]["category"] == rent.category_id
+    rent.refresh_from_db()
+    assert rent.actual_total == 791
+
+    ids = ",".join(str(e.id) for e in rows)
+    response = api_client.delete(f"/v3/expenditures/?id={ids}")
+    assert response.status_code == 204
+    assert not database.expenditures.filter(name__startswith="row").exists()
+    assert not fun.monthly_summaries.exists()
+    rent.refresh_from_db()
+    assert rent.actual_total == 790
+
+    assert api_client.delete("/v3/expenditures/").status_code == 400
+    assert api_client.delete(f"/v3/expenditures/?id={rows[0].id}").status_code == 404
+    assert (
+        api_client.patch(
+            "/v3/expenditures/", {"id": rent.id}, format="json"
+        ).status_code
+        == 400
+    )
+    assert api_client.patch("/v3/expenditures/", [], format="json").status_code == 400
+    response = api_client.patch(
+        "/v3/expenditures/",
+        [{"id": rent.id}, {"id": rent.id, "value": 9}],
+        format="json",
+    )
+    assert response.status_code == 400
+    assert response.json() == {"id": ["Ids must be unique."]}
+    rent.refresh_from_db()
+    assert rent.value == 800
+
+
+def test_bulk_operations_check_databases(database, user, api_client, monkeypatch):
+    other_user = User.objects.create_user("eve", "eve@example.com", "password")
+    other = Database.objects.create(name="other")
+    other.users.add(other_user)
+    cash = Cash.objects.create(
+        value=10, reference_date=timezone.make_aware(datetime(2025, 1, 1)), db=other
+    )
+    mine = database.cashes.first()
+
+    response = api_client.patch(
+        "/v3/cash/",
+        [{"id": mine.id, "value": 5}, {"id": cash.id, "value": 5}],
+        format="json",
+    )
+    assert response.status_code == 403
+    response = api_client.delete(f"/v3/cash/?id={mine.id},{cash.id}")
+    assert response.status_code == 403
+    assert Cash.objects.filter(id__in=[mine.id, cash.id]).count() == 2
+
+    # Rows cannot be moved to the categories of other databases
+    category = Category.objects.create(name="secret", db=other)
+    expenditure = Expenditure.objects.filter(name="groceries", db=database).first()
+    response = api_client.patch(
+        "/v3/expenditures/",
+        [{"id": expenditure.id, "category": category.id}],
+        format="json",
+    )
+    assert response.status_code == 400
+    # Even if the category is found, the database rows are written to is checked
+    monkeypatch.setattr(
+        ExpenditureListSerializer,
+        "get_prefetch_querysets",
+        lambda self: self.prefetch_querysets,
+    )
+    response = api_client.patch(
+        "/v3/expenditures/",
+        [{"id": expenditure.id, "category": category.id}],
+        format="json",
+    )
+    assert response.status_code == 403
+    expenditure.refresh_from_db()
+    assert expenditure.db_id == database.id
+
+    response = api_client.patch(
+        "/v3/cash/", [{"id": mine.id, "value": 5}], format="json"
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["value"] == 5
+    mine.refresh_from_db()
+    assert mine.value == 5
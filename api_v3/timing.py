@@ -0,0 +1,183 @@
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_recorder = contextvars.ContextVar("api_v3_timing_recorder", default=None)
+
+
+class Recorder:
+    """
+    Timings of one request. Queries are recorded from every thread running in the context
+    of the request: sync_to_async threads and the workers of the serializer sections.
+    With log_queries, the SQL of the queries is kept in log, not their parameters: they
+    hold user data. A recorder started while another is recording, as the one of the
+    profiler, adds its timings to it when stopped.
+    """
+
+    def __init__(self, parent=None, log_queries=False):
+        self.parent = parent
+        self.started = time.perf_counter()
+        self.total = None
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+        self.log = [] if log_queries else None
+        self._lock = threading.Lock()
+
+    def add_query(self, duration, sql=None, many=False, alias=None):
+        with self._lock:
+            self.queries += 1
+            self.db += duration
+            if self.log is not None:
+                self.log.append(
+                    {
+                        "db": alias,
+                        "sql": sql,
+                        "many": many,
+                        "ms": round(duration * 1000, 3),
+                    }
+                )
+
+    def add_serializer(self, duration):
+        with self._lock:
+            self.serializer += duration
+
+    def stop(self):
+        self.total = time.perf_counter() - self.started
+        if self.parent is not None:
+            with self.parent._lock:
+                self.parent.queries += self.queries
+                self.parent.db += self.db
+                self.parent.serializer += self.serializer
+
+
+def current():
+    return _recorder.get()
+
+
+def start(log_queries=False):
+    return _recorder.set(Recorder(_recorder.get(), log_queries))
+
+
+def stop(token):
+    recorder = _recorder.get()
+    _recorder.reset(token)
+    recorder.stop()
+    return recorder
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.add_query(
+            time.perf_counter() - started, sql, many, context["connection"].alias
+        )
+
+
+def _install_wrapper(sender, connection, **kwargs):
+    # The wrappers of a connection object outlive its reconnections
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+_enabled = False
+
+
+def enable():
+    """Record the queries of every connection, for serverTiming."""
+    global _enabled
+    connection_created.connect(_install_wrapper, dispatch_uid="api_v3.timing")
+    for connection in connections.all(initialized_only=True):
+        _install_wrapper(None, connection)
+    _enabled = True
+
+
+def enabled():
+    return _enabled
+
+
+@contextmanager
+def serializing():
+    """Add the time spent in the block to the serializer time of the request, if timed."""
+    recorder = _recorder.get()
+    if recorder is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.add_serializer(time.perf_counter() - started)
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    view_class = getattr(match.func, "cls", None)
+    if view_class is None:
+        return match.view_name
+    actions = getattr(match.func, "actions", None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f"{view_class.__name__}.{action}"
+
+
+def _db_id(request):
+    db_id = request.GET.get("db", request.headers.get("db", None))
+    match = getattr(request, "resolver_match", None)
+    if (
+        db_id is None
+        and match is not None
+        and (match.url_name or "").startswith("dbs-")
+    ):
+        db_id = match.kwargs.get("pk", None)
+    return db_id
+
+
+def report(request, response, recorder):
+    """Add the Server-Timing header to response and log the request if it is slow."""
+    view = _view_name(request)
+    metrics = [
+        f'db;dur={recorder.db * 1000:.1f};desc="{recorder.queries} queries"',
+        f"serializer;dur={recorder.serializer * 1000:.1f}",
+        f"total;dur={recorder.total * 1000:.1f}",
+    ]
+    if view is not None:
+        metrics.append(f'view;desc="{view}"')
+    if response.has_header("Server-Timing"):
+        metrics.insert(0, response["Server-Timing"])
+    response["Server-Timing"] = ", ".join(metrics)
+
+    if (
+        recorder.total * 1000 >= settings.API_SLOW_REQUEST_MS
+        or recorder.queries >= settings.API_SLOW_REQUEST_QUERIES
+    ):
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": view,
+            "db": _db_id(request),
+            "status": response.status_code,
+            "queries": recorder.queries,
+            "db_ms": round(recorder.db * 1000, 1),
+            "serializer_ms": round(recorder.serializer * 1000, 1),
+            "total_ms": round(recorder.total * 1000, 1),
+        }
+        logger.warning(
+            "Slow request %s", json.dumps(record), extra={"slow_request": record}
+        )
+    return response
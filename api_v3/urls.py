@@ -19,7 +19,27 @@ from rest_framework import routers
 
 from . import views
 
-router = routers.DefaultRouter()
+
+class BulkRouter(routers.DefaultRouter):
+    """Routes PATCH and DELETE on the list route to the bulk actions of views.BulkMixin."""
+
+    routes = [
+        (
+            route._replace(
+                mapping={
+                    **route.mapping,
+                    "patch": "bulk_partial_update",
+                    "delete": "bulk_destroy",
+                }
+            )
+            if route.name == "{basename}-list"
+            else route
+        )
+        for route in routers.DefaultRouter.routes
+    ]
+
+
+router = BulkRouter()
 router.register(r"users", views.UserViewSet, basename="users")
 router.register(r"dbs", views.DatabaseViewSet, basename="dbs")
 router.register(r"cash", views.CashViewSet, basename="cashes")
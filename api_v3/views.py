@@ -1,24 +1,42 @@
 from django.conf import settings
+from django.core.cache import caches
 from django.db.models import Q
-from django.http import JsonResponse, Http404
+from django.http import JsonResponse, Http404, StreamingHttpResponse
 from django.contrib.auth.models import User
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+import hashlib
 import json
 import logging
 
-from main.models import Database, Cash, Category, Expenditure
-from rest_framework import viewsets
+from main.models import Database, Cash, Category, Expenditure, get_db_version
+from rest_framework import serializers, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
 
 from .exceptions import NotAllowedAction
-from .permissions import DBPermission, DBRelatedPermission, UserPermission
+from .export import CSVRenderer, JSONLinesRenderer, export_rows
+from .pagination import KeysetPagination
+from . import profiling, timing
+from .request import ParsedRequestMixin
+from .permissions import (
+    DBPermission,
+    DBRelatedPermission,
+    UserPermission,
+    get_db_ids,
+)
 from .serializers import (
     PrivateUserSerializer,
     PublicUserSerializer,
     CategorySerializer,
     FullDatabaseSerializer,
     GraphDatabaseSerializer,
+    TimeSeriesDatabaseSerializer,
     SimpleDatabaseSerializer,
     CashSerializer,
     ExpenditureSerializer,
@@ -67,9 +85,33 @@ class ExtendedAuthToken(ObtainAuthToken):
         )
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class ServerTimingMixin:
+    """
+    The time spent building the data of the serializers is added to the timings of the
+    request. As ListModelMixin.list and RetrieveModelMixin.retrieve, with the access to
+    serializer.data timed.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(queryset if page is None else page, many=True)
+        with timing.serializing():
+            data = serializer.data
+        if page is None:
+            return Response(data)
+        return self.get_paginated_response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_serializer(self.get_object())
+        with timing.serializing():
+            data = serializer.data
+        return Response(data)
+
+
+class UserViewSet(ServerTimingMixin, viewsets.ModelViewSet, ParsedRequestMixin):
     permission_classes = [UserPermission]
-    paginator = None
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         ids = self.request.params.get("ids", None)
@@ -85,12 +127,13 @@ class UserViewSet(viewsets.ModelViewSet):
         return PublicUserSerializer
 
 
-class UserSearchViewSet(viewsets.ModelViewSet):
+class UserSearchViewSet(ServerTimingMixin, viewsets.ModelViewSet, ParsedRequestMixin):
     permission_classes = [UserPermission]
     http_method_names = ["options", "head", "get"]
     model = User
     serializer_class = PublicUserSerializer
-    paginator = None
+    pagination_class = KeysetPagination
+    cursor_ordering = ["username", "id"]
 
     def get_queryset(self):
         """
@@ -104,17 +147,22 @@ class UserSearchViewSet(viewsets.ModelViewSet):
         ).order_by("username")
 
 
-class DBRelatedViewSet(viewsets.ModelViewSet):
+class DBRelatedViewSet(ServerTimingMixin, viewsets.ModelViewSet, ParsedRequestMixin):
     permission_classes = [DBRelatedPermission]
     http_method_names = ["options", "head", "get", "post", "patch", "update", "delete"]
 
     def _attach_db(self):
         db_id = self.request.params.get("db", [self.request.headers.get("db", None)])[0]
         if db_id:
-            dbs = Database.objects.filter(users__in=[self.request.user], id=db_id)
-            if not dbs.count():
+            try:
+                db_id = int(db_id)
+            except ValueError:
+                raise Http404
+            if db_id not in get_db_ids(self.request):
                 raise Http404
-            self.request.db = dbs.first()
+            # Fetched only if needed, membership is already known
+            self.request.db_id = db_id
+            self.request.db = SimpleLazyObject(lambda: Database.objects.get(id=db_id))
 
     def initial(self, request, *args, **kwargs):
         ret = super().initial(request, *args, **kwargs)
@@ -122,11 +170,113 @@ class DBRelatedViewSet(viewsets.ModelViewSet):
         return ret
 
     def get_queryset(self):
-        return self.model.objects.filter(db__users__in=[self.request.user])
+        return self.model.objects.filter(db__in=get_db_ids(self.request))
+
+
+class VersionETagMixin:
+    """
+    Responses to list and retrieve carry an ETag derived from the version of their database,
+    the month, the endpoint and the user. Requests whose If-None-Match matches it are answered
+    with 304 without serializing anything.
+    """
+
+    def get_versioned_db_id(self):
+        """
+        Id of the only database the response depends on, if the user belongs to it.
+        None if not known.
+        """
+        if self.kwargs.get("pk", None) is not None or self.request.params.get("id"):
+            return None
+        return getattr(self.request, "db_id", None)
+
+    def get_etag(self):
+        db_id = self.get_versioned_db_id()
+        if db_id is None:
+            return None
+        version = get_db_version(db_id)
+        if version is None:
+            return None
+        key = ":".join(
+            [
+                str(db_id),
+                str(version),
+                self.request.min_date.strftime("%Y-%m"),
+                self.request.get_full_path(),
+                str(self.request.user.pk),
+            ]
+        )
+        return quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    def _conditional(self, handler, request, *args, **kwargs):
+        etag = self.get_etag()
+        response = None
+        if etag is not None:
+            response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if etag is not None:
+            response["ETag"] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(super().retrieve, request, *args, **kwargs)
+
+
+class ResponseCacheMixin:
+    """
+    Caches the data of the responses of response_cache_actions in the API_CACHE cache.
+    Keys include the version of the database, so writes invalidate them, and hits skip the ORM.
+    Relies on VersionETagMixin.get_versioned_db_id.
+    """
+
+    response_cache_actions = []
+    response_cache_timeout = 60 * 60 * 24
+
+    def get_response_cache_key(self):
+        if self.action not in self.response_cache_actions:
+            return None
+        # Profiled requests are served by the views, not from the cache
+        if profiling.active():
+            return None
+        db_id = self.get_versioned_db_id()
+        if db_id is None:
+            return None
+        version = get_db_version(db_id)
+        if version is None:
+            return None
+        path = hashlib.md5(self.request.get_full_path().encode()).hexdigest()
+        return ":".join(
+            [
+                "api_v3:response",
+                str(db_id),
+                str(version),
+                self.get_serializer_class().__name__,
+                self.request.min_date.strftime("%Y-%m"),
+                # Some figures default to the current month
+                timezone.localdate().strftime("%Y-%m"),
+                path,
+            ]
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        key = self.get_response_cache_key()
+        if key is None:
+            return super().retrieve(request, *args, **kwargs)
+        cache = caches[settings.API_CACHE]
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = super().retrieve(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, self.response_cache_timeout)
+        return response
 
 
-class ModelViewSet(viewsets.ModelViewSet):
-    paginator = None
+class ModelViewSet(VersionETagMixin, ResponseCacheMixin, viewsets.ModelViewSet):
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         # First call DBRelated.get_queryset that also provide self.request.db if available
@@ -141,17 +291,114 @@ class ModelViewSet(viewsets.ModelViewSet):
                 if ids:
                     queryset = queryset.filter(id__in=ids)
                 # If id are not provided try to limit queryset by fetching only object related to db found in headers or parameters
-                elif hasattr(self.request, "db"):
-                    queryset = queryset.filter(db=self.request.db)
+                elif hasattr(self.request, "db_id"):
+                    # By id, filtering by request.db would fetch the database
+                    queryset = queryset.filter(db_id=self.request.db_id)
                 else:
                     # Raise not allowed action if list is not limited by one or multiple id in params or database found in headers or parameters
                     raise NotAllowedAction("list")
+                if not queryset.ordered:
+                    # Otherwise rows come in the order of the index used to filter them
+                    queryset = queryset.order_by("id")
         return queryset
 
 
+class StreamingListMixin:
+    """
+    With stream=true, lists are written as a JSON array streamed in chunks of
+    stream_chunk_size rows, so that memory does not grow with the number of rows.
+    """
+
+    stream_query_param = "stream"
+    stream_chunk_size = 500
+
+    def _stream_rows(self, queryset):
+        renderer = JSONRenderer()
+        serializer = self.get_serializer()
+        separator = b""
+        yield b"["
+        chunk = []
+        for instance in queryset.iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(renderer.render(serializer.to_representation(instance)))
+            if len(chunk) == self.stream_chunk_size:
+                yield separator + b",".join(chunk)
+                separator = b","
+                chunk = []
+        if chunk:
+            yield separator + b",".join(chunk)
+        yield b"]"
+
+    def list(self, request, *args, **kwargs):
+        stream = request.params.get(self.stream_query_param, ["false"])[0]
+        if stream.lower() not in ["true", "1"]:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return StreamingHttpResponse(
+            self._stream_rows(queryset), content_type="application/json"
+        )
+
+
+class BulkMixin:
+    """
+    PATCH on the list route with a list of objects with their id updates them at once and
+    DELETE with ?id=1,2,3 deletes them at once.
+    Permissions are checked once for every database of the objects, and the serializer
+    checks the database every object is written to (see BulkListSerializer.check_db).
+    """
+
+    def get_bulk_queryset(self):
+        return self.model.objects.all()
+
+    def _parse_ids(self, ids):
+        try:
+            return [int(id) for id in ids]
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({"id": ["A valid integer is required."]})
+
+    def _check_bulk_permissions(self, ids):
+        dbs = dict(self.model.objects.filter(id__in=ids).values_list("id", "db"))
+        if len(dbs) != len(set(ids)):
+            raise NotFound
+        if not set(dbs.values()) <= get_db_ids(self.request):
+            self.permission_denied(self.request)
+
+    def bulk_partial_update(self, request, *args, **kwargs):
+        if not isinstance(request.data, list) or not all(
+            isinstance(item, dict) and "id" in item for item in request.data
+        ):
+            raise serializers.ValidationError(
+                {"non_field_errors": ["Expected a list of objects with their id."]}
+            )
+        ids = self._parse_ids(item["id"] for item in request.data)
+        if not ids:
+            raise NotAllowedAction("patch")
+        if len(set(ids)) != len(ids):
+            raise serializers.ValidationError({"id": ["Ids must be unique."]})
+        self._check_bulk_permissions(ids)
+        instances = list(self.get_bulk_queryset().filter(id__in=ids))
+        serializer = self.get_serializer(
+            instances, data=request.data, many=True, partial=True
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        with timing.serializing():
+            data = serializer.data
+        return Response(data)
+
+    def bulk_destroy(self, request, *args, **kwargs):
+        ids = self._parse_ids(
+            id for value in request.params.get("id", []) for id in value.split(",")
+        )
+        if not ids:
+            raise NotAllowedAction("delete")
+        self._check_bulk_permissions(ids)
+        self.get_bulk_queryset().filter(id__in=ids).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class DatabaseDBRelatedAdapter(DBRelatedViewSet):
     def get_queryset(self):
-        return self.model.objects.filter(users__in=[self.request.user])
+        return self.model.objects.filter(id__in=get_db_ids(self.request))
 
 
 class DatabaseViewSet(
@@ -161,6 +408,7 @@ class DatabaseViewSet(
     model = Database
     serializer_class = FullDatabaseSerializer
     permission_classes = [DBPermission]
+    response_cache_actions = ["retrieve", "graph"]
 
     def get_serializer_class(self):
         method = self.request.method
@@ -169,6 +417,13 @@ class DatabaseViewSet(
             return SimpleDatabaseSerializer
         return super().get_serializer_class()
 
+    def get_versioned_db_id(self):
+        try:
+            db_id = int(self.kwargs.get("pk", None))
+        except (TypeError, ValueError):
+            return None
+        return db_id if db_id in get_db_ids(self.request) else None
+
     @action(
         detail=True,
         methods=["get", "head", "options"],
@@ -177,8 +432,50 @@ class DatabaseViewSet(
     def graph(self, request, *args, **kwargs):
         return super().retrieve(request, *args, **kwargs)
 
+    @action(
+        detail=True,
+        methods=["get", "head", "options"],
+        serializer_class=TimeSeriesDatabaseSerializer,
+    )
+    def timeseries(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def _get_export_dates(self):
+        dates = {}
+        for param, key in [("from", "min_date"), ("to", "max_date")]:
+            value = self.request.params.get(param, None)
+            if value is None:
+                continue
+            try:
+                dates[key] = serializers.DateTimeField().to_internal_value(value[0])
+            except serializers.ValidationError as e:
+                raise serializers.ValidationError({param: e.detail})
+        return dates
 
-class CashViewSet(ModelViewSet, DBRelatedViewSet):
+    @action(
+        detail=True,
+        methods=["get", "head", "options"],
+        renderer_classes=[JSONLinesRenderer, CSVRenderer],
+    )
+    def export(self, request, *args, **kwargs):
+        """
+        Stream every category, cash and expenditure of the database.
+        Available parameters are format ['jsonl', 'csv'], from, to
+        """
+        database = self.get_object()
+        rows = export_rows(database, **self._get_export_dates())
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(rows),
+            content_type=f"{renderer.media_type}; charset={renderer.charset}",
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="db-{database.id}.{renderer.format}"'
+        )
+        return response
+
+
+class CashViewSet(BulkMixin, ModelViewSet, DBRelatedViewSet):
     model = Cash
     serializer_class = CashSerializer
 
@@ -188,9 +485,19 @@ class CategoryViewSet(ModelViewSet, DBRelatedViewSet):
     serializer_class = CategorySerializer
 
 
-class ExpenditureViewSet(ModelViewSet, DBRelatedViewSet):
+class ExpenditureViewSet(BulkMixin, StreamingListMixin, ModelViewSet, DBRelatedViewSet):
     model = Expenditure
     serializer_class = ExpenditureSerializer
+    cursor_ordering = ["-date", "-id"]
+
+    def get_bulk_queryset(self):
+        return self.model.objects.select_related("category__db")
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method == "GET":
+            queryset = queryset.with_prospect()
+        return queryset
 
     def get_serializer(self, *args, **kwargs):
         if "many" not in kwargs:
@@ -200,39 +507,37 @@ class ExpenditureViewSet(ModelViewSet, DBRelatedViewSet):
         return super().get_serializer(*args, **kwargs)
 
 
-class ExpenditureSearchViewSet(DBRelatedViewSet):
+class ExpenditureSearchViewSet(StreamingListMixin, DBRelatedViewSet):
     http_method_names = ["options", "head", "get"]
     model = Expenditure
     serializer_class = ExpenditureSerializer
-    paginator = None
+    pagination_class = KeysetPagination
 
     def _queryset_from_queryString(self, queryset):
         query_string = self.request.params.get("queryString", None)
         if query_string is None:
             return queryset
-        query_string = query_string[0]
-        queries = [
-            [Q(name__icontains=AND) for AND in OR.strip().split(" ")]
-            for OR in query_string.split(",")
-        ]
-        ORS = []
-        for qs in queries:
-            query = qs[0]
-            for i in range(1, len(qs)):
-                query = query & qs[i]
-            ORS.append(query)
-        query = ORS[0]
-        for i in range(1, len(ORS)):
-            query = query | ORS[i]
-
-        return queryset.filter(query)
+        return queryset.search(query_string[0])
+
+    def _ordering(self):
+        if (
+            "queryString" in self.request.params
+            and self.request.params.get("ordering", [None])[0] == "relevance"
+        ):
+            return ["-search_rank", "-date", "-id"]
+        return ["-date", "-id"]
+
+    @property
+    def cursor_ordering(self):
+        return self._ordering()
 
     def get_queryset(self):
         """
-        Available parameters are queryString, from, to, lowerPrice, upperPrice, type ['both', 'actual', 'expected']
+        Available parameters are queryString, from, to, lowerPrice, upperPrice, type ['both', 'actual', 'expected'],
+        ordering ['date', 'relevance']
         """
         other_parameters = False
-        query = Q(db__in=self.request.user.dbs.all())
+        query = Q(db__in=get_db_ids(self.request))
         for key, value in self.request.params.items():
             if key == "from":
                 other_parameters = True
@@ -256,5 +561,5 @@ class ExpenditureSearchViewSet(DBRelatedViewSet):
         if other_parameters or len(self.request.params.get("queryString", [])) > 0:
             queryset = Expenditure.objects.filter(query)
             queryset = self._queryset_from_queryString(queryset)
-            return queryset.order_by("-date")
+            return queryset.with_prospect().order_by(*self._ordering())
         return Expenditure.objects.none()
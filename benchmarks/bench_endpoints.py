@@ -0,0 +1,227 @@
+"""
+Latency and query counts of the API routes at several data sizes.
+
+    python benchmarks/bench_endpoints.py run [--sizes small medium] [--repeat N] [--output FILE]
+    python benchmarks/bench_endpoints.py compare BASELINE RESULTS [--threshold 0.2]
+
+run generates a synthetic database of every size (see main.synthetic) in a temporary SQLite
+database and requests every route repeat times, with the caches cleared before each request,
+and writes the percentiles of the latencies and the number of queries to a JSON file.
+compare reports the routes slower (p95 more than threshold slower and at least 1ms) or with
+more queries than in the baseline and exits with status 1 if there are any. Keep the output
+of a run on the main branch as the baseline, timings are only comparable on the same machine.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "expendituresTracer.settings")
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+django.setup()
+
+# Arguments of main.synthetic.generate_database
+SIZES = {
+    "small": {"users": 2, "categories": 5, "years": 1, "expenditures": 20},
+    "medium": {"users": 3, "categories": 10, "years": 3, "expenditures": 60},
+    "large": {"users": 5, "categories": 20, "years": 5, "expenditures": 200},
+}
+
+PASSWORD = "benchmark"
+
+
+def routes(database, month):
+    """Name, method, path and data of the requests to measure."""
+    db_id = database.pk
+    user = database.users.order_by("id").first()
+    return [
+        ("dbs list", "get", f"/v3/dbs/?id={db_id}", None),
+        ("dbs retrieve", "get", f"/v3/dbs/{db_id}/", None),
+        ("dbs graph", "get", f"/v3/dbs/{db_id}/graph/", None),
+        ("dbs timeseries", "get", f"/v3/dbs/{db_id}/timeseries/", None),
+        ("categories", "get", f"/v3/categories/?db={db_id}", None),
+        ("cash", "get", f"/v3/cash/?db={db_id}", None),
+        ("expenditures", "get", f"/v3/expenditures/?db={db_id}", None),
+        (
+            "expenditures page",
+            "get",
+            f"/v3/expenditures/?db={db_id}&pageSize=50",
+            None,
+        ),
+        (
+            "search",
+            "get",
+            "/v3/expenditures/search/?queryString=super,dinner",
+            None,
+        ),
+        ("auth user", "get", "/v3/api-token-auth/", None),
+        (
+            "auth login",
+            "post",
+            "/v3/api-token-auth/",
+            {"username": user.username, "password": PASSWORD},
+        ),
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, round(len(values) * fraction) - 1)]
+
+
+def measure(client, method, path, data, repeat, headers):
+    from django.core.cache import caches
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from main.security import token_cache
+
+    # Warm up, the first request of a route loads modules and fills in-process caches
+    getattr(client, method)(path, data, **headers)
+    latencies = []
+    queries = None
+    for _ in range(repeat):
+        for cache in caches.all():
+            cache.clear()
+        token_cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, method)(path, data, **headers)
+            if response.streaming:
+                b"".join(response)
+            latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code < 400, (path, response.status_code)
+        queries = len(captured)
+    return {
+        "p50": statistics.median(latencies),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "mean": statistics.mean(latencies),
+        "queries": queries,
+    }
+
+
+def run(args):
+    from django.core.management import call_command
+    from django.test import Client
+    from django.utils import timezone
+    from rest_framework.authtoken.models import Token
+
+    from main.synthetic import generate_database
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        settings.DATABASES["default"]["NAME"] = os.path.join(directory, "bench.sqlite3")
+        call_command("migrate", verbosity=0)
+        month = timezone.localdate().strftime("%m-%Y")
+        for size in args.sizes:
+            started = time.perf_counter()
+            database = generate_database(
+                name=f"bench-{size}", password=PASSWORD, seed=0, **SIZES[size]
+            )
+            print(
+                f"{size}: generated {database.expenditures.count()} expenditures "
+                f"in {time.perf_counter() - started:.1f}s"
+            )
+            user = database.users.order_by("id").first()
+            token = Token.objects.create(user=user)
+            headers = {
+                "HTTP_AUTHORIZATION": f"Token {token.key}",
+                "HTTP_MONTH": month,
+                "HTTP_HOST": "localhost",
+            }
+            client = Client()
+            results[size] = {}
+            for name, method, path, data in routes(database, month):
+                result = measure(client, method, path, data, args.repeat, headers)
+                results[size][name] = result
+                print(
+                    f"  {name:<20}p50 {result['p50']:8.2f}ms  p95 {result['p95']:8.2f}ms"
+                    f"  {result['queries']:3d} queries"
+                )
+
+    output = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "repeat": args.repeat,
+        "sizes": {size: SIZES[size] for size in args.sizes},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.results) as f:
+        results = json.load(f)["results"]
+
+    regressions = []
+    for size, routes_results in results.items():
+        for name, result in routes_results.items():
+            base = baseline.get(size, {}).get(name, None)
+            if base is None:
+                continue
+            slower = (result["p95"] - base["p95"]) / base["p95"] if base["p95"] else 0
+            problems = []
+            if slower > args.threshold and result["p95"] - base["p95"] >= 1:
+                problems.append(
+                    f"p95 {base['p95']:.2f}ms -> {result['p95']:.2f}ms (+{slower:.0%})"
+                )
+            if result["queries"] > base["queries"]:
+                problems.append(f"queries {base['queries']} -> {result['queries']}")
+            if problems:
+                regressions.append(f"{size} {name}: {', '.join(problems)}")
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    if regressions:
+        sys.exit(1)
+    print("No regressions.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Measure the routes.")
+    run_parser.add_argument(
+        "--sizes", nargs="+", choices=list(SIZES), default=["small", "medium"]
+    )
+    run_parser.add_argument("--repeat", type=int, default=20)
+    run_parser.add_argument("--output", default="benchmark-results.json")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = subparsers.add_parser(
+        "compare", help="Flag regressions against a baseline."
+    )
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    compare_parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Tolerated relative increase of p95 latencies.",
+    )
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
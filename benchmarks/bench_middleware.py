@@ -0,0 +1,110 @@
+"""
+Compare the lazy request parsing of api_v3.request.ParsedRequest with the eager middlewares
+it replaced.
+
+    python benchmarks/bench_middleware.py [--number N]
+
+Each case times a request going through the middleware chain, being wrapped in the request
+of the API views and having the attributes the views of that case read read.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+from urllib import parse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "expendituresTracer.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+from dateutil.relativedelta import relativedelta  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from rest_framework.request import Request  # noqa: E402
+
+from api_v3.request import ParsedRequest  # noqa: E402
+
+
+# The middlewares as they were before ParsedRequest
+def parseQueryString(get_response):
+    def middleware(request):
+        request.params = parse.parse_qs(request.META["QUERY_STRING"])
+        return get_response(request)
+
+    return middleware
+
+
+def parseMonth(get_response):
+    def middleware(request):
+        month = request.params.get("month", [request.headers.get("month", None)])[0]
+        if month:
+            month, year = [int(x.strip()) for x in month.split("-")[:2]]
+        else:
+            n = datetime.now()
+            month = n.month
+            year = n.year
+        min_date = datetime(year, month, 1)
+        request.min_date = timezone.make_aware(min_date)
+        request.max_date = timezone.make_aware(min_date + relativedelta(months=1))
+        return get_response(request)
+
+    return middleware
+
+
+CASES = [
+    ("no attribute read", "/v3/dbs/1/", {}, []),
+    ("params", "/v3/expenditures/?db=1&pageSize=50", {}, ["params"]),
+    (
+        "params and month",
+        "/v3/categories/?db=1",
+        {"HTTP_MONTH": "01-2025"},
+        ["params", "min_date", "max_date"],
+    ),
+]
+
+
+def view_reading(attributes, request_class):
+    def view(request):
+        request = request_class(request)
+        for attribute in attributes:
+            getattr(request, attribute)
+        # Views read them more than once
+        for attribute in attributes:
+            getattr(request, attribute)
+
+    return view
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    factory = RequestFactory()
+    print(f"{'case':<20}{'eager (us)':>12}{'lazy (us)':>12}")
+    for name, path, headers, attributes in CASES:
+        eager = parseQueryString(parseMonth(view_reading(attributes, Request)))
+        lazy = view_reading(attributes, ParsedRequest)
+        timings = []
+        for chain in (eager, lazy):
+            # Requests are built outside of the timing
+            requests = [factory.get(path, **headers) for _ in range(args.number)]
+            requests_iter = iter(requests)
+            # Warm up
+            chain(factory.get(path, **headers))
+            seconds = timeit.timeit(
+                lambda: chain(next(requests_iter)), number=args.number
+            )
+            timings.append(seconds / args.number * 1e6)
+        print(f"{name:<20}{timings[0]:>12.2f}{timings[1]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
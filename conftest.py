@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from main.models import Database
+
+
+@pytest.fixture
+def aware():
+    """Build aware datetimes in the current timezone, at noon by default."""
+
+    def build(year, month, day, hour=12):
+        return timezone.make_aware(datetime(year, month, day, hour))
+
+    return build
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user("alice", "alice@example.com", "password")
+
+
+@pytest.fixture
+def database(user):
+    database = Database.objects.create(name="home")
+    database.users.add(user)
+    return database
+
+
+@pytest.fixture
+def count_queries():
+    """
+    Count the queries of a GET, without the cached membership, versions and responses, so
+    that tests can check that they do not depend on the number of rows.
+    """
+
+    def count(client, url, **extra):
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, **extra)
+        assert response.status_code == 200
+        return len(context.captured_queries)
+
+    return count
@@ -48,8 +48,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
-    "api_v3.middleware.parseQueryString",
-    "api_v3.middleware.parseMonth",
+    "api_v3.middleware.serverTiming",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -57,6 +56,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api_v3.middleware.profileRequest",
 ]
 
 ROOT_URLCONF = "expendituresTracer.urls"
@@ -100,6 +100,20 @@ DATABASES = {
 }
 
 
+# Shared by the worker processes, so that the invalidations of membership, database versions
+# and responses reach all of them
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, ".cache"),
+        # Responses are keyed by database version and stale ones stay until they expire,
+        # the default of 300 entries would be culled constantly. Every set lists the files
+        # of the cache, so the limit also bounds the cost of writing to it.
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -150,12 +164,36 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 50,
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "main.security.CachedTokenAuthentication",
         "main.security.CSRFExemptSessionAuthentication",
     ),
     "EXCEPTION_HANDLER": "api_v3.exception_handler.custom_exception_handler",
 }
 
+# Cache of the rendered database responses (see api_v3.views.ResponseCacheMixin)
+API_CACHE = "default"
+
+# Threads evaluating the sections of FullDatabaseSerializer concurrently, each with its own
+# database connection (see api_v3.serializers.sections). 0 evaluates them one after another.
+# Pays off with persistent connections (CONN_MAX_AGE), otherwise every section connects.
+API_SECTION_WORKERS = 0
+
+# Time the requests: number of queries, database, serializer and total times in a
+# Server-Timing header, and a warning of the api_v3.timing logger for the requests slower
+# than API_SLOW_REQUEST_MS or with at least API_SLOW_REQUEST_QUERIES queries.
+# Disabled, the middleware is left out of the chain. Enabled by API_TIMING=true in .env.
+API_TIMING = (
+    dotenv_values(os.path.join(BASE_DIR, ".env")).get("API_TIMING") or ""
+).lower() == "true"
+API_SLOW_REQUEST_MS = 1000
+API_SLOW_REQUEST_QUERIES = 50
+
+# Staff users sending X-Profile: 1 to /v3/ get their request profiled by cProfile, the stats
+# and the queries are saved in this directory (see api_v3.profiling). None disables it.
+# Only set by API_PROFILE_DIR in .env, the API_PROFILE_KEEP latest profiles are kept.
+API_PROFILE_DIR = dotenv_values(os.path.join(BASE_DIR, ".env")).get("API_PROFILE_DIR")
+API_PROFILE_KEEP = 100
+
 CORS_ALLOWED_ORIGINS = [
     dotenv_values(os.path.join(BASE_DIR, ".env"))["CORS_ALLOWED_ORIGIN"],
 ]
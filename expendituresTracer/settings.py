@@ -52,8 +52,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
-    "api_v3.middleware.parseQueryString",
-    "api_v3.middleware.parseMonth",
+    "api_v3.middleware.serverTiming",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
@@ -61,6 +60,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "api_v3.middleware.profileRequest",
 ]
 
 ROOT_URLCONF = "expendituresTracer.urls"
@@ -144,12 +144,34 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 50,
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "main.security.CachedTokenAuthentication",
         "main.security.CSRFExemptSessionAuthentication",
     ),
     "EXCEPTION_HANDLER": "api_v3.exception_handler.custom_exception_handler",
 }
 
+# Cache of the rendered database responses (see api_v3.views.ResponseCacheMixin)
+API_CACHE = "default"
+
+# Threads evaluating the sections of FullDatabaseSerializer concurrently, each with its own
+# database connection (see api_v3.serializers.sections). 0 evaluates them one after another.
+# Pays off with persistent connections (CONN_MAX_AGE), otherwise every section connects.
+API_SECTION_WORKERS = 0
+
+# Time the requests: number of queries, database, serializer and total times in a
+# Server-Timing header, and a warning of the api_v3.timing logger for the requests slower
+# than API_SLOW_REQUEST_MS or with at least API_SLOW_REQUEST_QUERIES queries.
+# Disabled, the middleware is left out of the chain.
+API_TIMING = False
+API_SLOW_REQUEST_MS = 1000
+API_SLOW_REQUEST_QUERIES = 50
+
+# Staff users sending X-Profile: 1 to /v3/ get their request profiled by cProfile, the stats
+# and the queries are saved in this directory (see api_v3.profiling). None disables it.
+# Only the API_PROFILE_KEEP latest profiles are kept.
+API_PROFILE_DIR = os.path.join(BASE_DIR, ".profiles")
+API_PROFILE_KEEP = 100
+
 CORS_ALLOWED_ORIGINS = [
     "http://127.0.0.1:3000",
     "http://localhost:3000",
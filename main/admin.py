@@ -1,8 +1,9 @@
 from django.contrib import admin
-from .models import Database, Cash, Category, Expenditure
+from .models import Database, Cash, Category, Expenditure, MonthlySummary
 # Register your models here.
 
 admin.site.register(Database)
 admin.site.register(Cash)
 admin.site.register(Category)
-admin.site.register(Expenditure)
\ No newline at end of file
+admin.site.register(Expenditure)
+admin.site.register(MonthlySummary)
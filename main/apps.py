@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MainConfig(AppConfig):
     name = 'main'
+
+    def ready(self):
+        from . import search
+
+        post_migrate.connect(search.install_missing, sender=self)
@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from main.models import Expenditure
+
+
+class Command(BaseCommand):
+    help = "Check actual_total and actual_count of expected expenditures against their actual expenditures."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Recompute the inconsistent expenditures.",
+        )
+
+    def handle(self, *args, repair=False, **options):
+        actuals = (
+            Expenditure.objects.filter(expected_expenditure=models.OuterRef("pk"))
+            .order_by()
+            .values("expected_expenditure")
+        )
+        expenditures = (
+            Expenditure.objects.filter(
+                models.Q(is_expected=True) | models.Q(actual_count__gt=0)
+            )
+            .annotate(
+                total=models.Subquery(
+                    actuals.annotate(total=models.Sum("value")).values("total")
+                ),
+                count=models.Subquery(
+                    actuals.annotate(count=models.Count("id")).values("count")
+                ),
+            )
+            .values_list("id", "actual_total", "actual_count", "total", "count")
+        )
+
+        inconsistent = []
+        for pk, actual_total, actual_count, total, count in expenditures.iterator():
+            if actual_total != (total or 0) or actual_count != (count or 0):
+                inconsistent.append(pk)
+                self.stdout.write(
+                    f"Expenditure {pk}: stored {actual_total} ({actual_count}), "
+                    f"actual {total or 0} ({count or 0})"
+                )
+
+        if not inconsistent:
+            self.stdout.write(self.style.SUCCESS("All actual totals are consistent."))
+            return
+        if repair:
+            Expenditure.objects.filter(pk__in=inconsistent).refresh_actual_total()
+            self.stdout.write(
+                self.style.SUCCESS(f"Repaired {len(inconsistent)} expenditures.")
+            )
+        else:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"{len(inconsistent)} inconsistent expenditures, run with --repair to fix them."
+                )
+            )
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from main.synthetic import generate_database
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate databases with synthetic users, categories, cashes and expenditures."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--databases", type=int, default=1, help="Number of databases."
+        )
+        parser.add_argument(
+            "--users", type=int, default=3, help="Users of every database."
+        )
+        parser.add_argument(
+            "--categories", type=int, default=10, help="Categories of every database."
+        )
+        parser.add_argument(
+            "--years", type=int, default=2, help="Years of history, up to this month."
+        )
+        parser.add_argument(
+            "--expenditures",
+            type=int,
+            default=40,
+            help="Actual expenditures of every month.",
+        )
+        parser.add_argument(
+            "--name", default="synthetic", help="Name of the databases."
+        )
+        parser.add_argument(
+            "--password", default="synthetic", help="Password of the generated users."
+        )
+        parser.add_argument(
+            "--seed", type=int, help="Seed of the generator, for repeatable data."
+        )
+
+    def handle(self, *args, databases=1, seed=None, **options):
+        for i in range(databases):
+            database = generate_database(
+                name=options["name"],
+                users=options["users"],
+                categories=options["categories"],
+                years=options["years"],
+                expenditures=options["expenditures"],
+                password=options["password"],
+                seed=None if seed is None else seed + i,
+            )
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Created database {database.pk} with {database.users.count()} users, "
+                    f"{database.categories.count()} categories, "
+                    f"{database.cashes.count()} cashes and "
+                    f"{database.expenditures.count()} expenditures."
+                )
+            )
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from main.models import MonthlySummary
+
+
+class Command(BaseCommand):
+    help = "Rebuild the monthly summaries from expenditures and cashes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--db",
+            type=int,
+            nargs="+",
+            dest="databases",
+            help="Rebuild only the summaries of these database ids.",
+        )
+
+    def handle(self, *args, databases=None, **options):
+        count = MonthlySummary.objects.rebuild(databases)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} monthly summaries."))
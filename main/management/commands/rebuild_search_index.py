@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from main import search
+
+
+class Command(BaseCommand):
+    help = "Create (or recreate) the full-text search index of expenditure names."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="Database alias to rebuild the index of.",
+        )
+
+    def handle(self, *args, database=DEFAULT_DB_ALIAS, **options):
+        connection = connections[database]
+        search.install(connection)
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt the search index on {connection.vendor}.")
+        )
@@ -0,0 +1,91 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+
+def rebuild_monthly_summaries(apps, schema_editor):
+    # Against the historical models: the live ones may have moved on since
+    alias = schema_editor.connection.alias
+    Expenditure = apps.get_model('main', 'Expenditure')
+    Cash = apps.get_model('main', 'Cash')
+    MonthlySummary = apps.get_model('main', 'MonthlySummary')
+    tzinfo = timezone.get_default_timezone()
+
+    def month(field):
+        return TruncMonth(field, output_field=models.DateField(), tzinfo=tzinfo)
+
+    summaries = {}
+
+    def get(db_id, month, category_id=None):
+        key = (db_id, month, category_id)
+        if key not in summaries:
+            summaries[key] = MonthlySummary(
+                db_id=db_id, month=month, category_id=category_id)
+        return summaries[key]
+
+    for row in (
+        Expenditure.objects.using(alias).filter(date__isnull=False)
+        .order_by()
+        .annotate(month=month('date'))
+        .values('db', 'month', 'category')
+        .annotate(
+            expected=models.Sum(
+                'value', filter=models.Q(is_expected=True), default=0),
+            actual=models.Sum(
+                'value', filter=models.Q(is_expected=False), default=0),
+        )
+    ):
+        summary = get(row['db'], row['month'], row['category'])
+        summary.expected_expenditure = row['expected']
+        summary.actual_expenditure = row['actual']
+    cashes = Cash.objects.using(alias)
+    for row in (
+        cashes.filter(income=True)
+        .order_by()
+        .annotate(month=month('reference_date'))
+        .values('db', 'month')
+        .annotate(income=models.Sum('value'))
+    ):
+        get(row['db'], row['month']).income = row['income']
+    for cash_id, db_id, reference_date, value in (
+        cashes.filter(income=False)
+        .order_by('reference_date', 'id')
+        .values_list('id', 'db', 'reference_date', 'value')
+        .iterator()
+    ):
+        local_date = timezone.localtime(reference_date, tzinfo).date()
+        summary = get(db_id, local_date.replace(day=1))
+        summary.cash_id = cash_id
+        summary.cash_value = value
+    MonthlySummary.objects.using(alias).bulk_create(summaries.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_alter_cash_id_alter_category_id_alter_database_id_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('expected_expenditure', models.DecimalField(decimal_places=2, default=0, max_digits=13)),
+                ('actual_expenditure', models.DecimalField(decimal_places=2, default=0, max_digits=13)),
+                ('income', models.DecimalField(decimal_places=2, default=0, max_digits=13)),
+                ('cash_value', models.DecimalField(blank=True, decimal_places=2, max_digits=11, null=True)),
+                ('cash', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='main.cash')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='monthly_summaries', to='main.category')),
+                ('db', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_summaries', to='main.database')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('db', 'month', 'category'), name='unique_monthly_summary'), models.UniqueConstraint(condition=models.Q(('category', None)), fields=('db', 'month'), name='unique_monthly_db_summary')],
+            },
+        ),
+        migrations.RunPython(rebuild_monthly_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:26
+
+from django.db import migrations, models
+
+
+def compute_actual_total(apps, schema_editor):
+    Expenditure = apps.get_model("main", "Expenditure")
+    actuals = (
+        Expenditure.objects.filter(expected_expenditure=models.OuterRef("pk"))
+        .order_by()
+        .values("expected_expenditure")
+    )
+    Expenditure.objects.filter(is_expected=True).update(
+        actual_total=models.functions.Coalesce(
+            models.Subquery(
+                actuals.annotate(total=models.Sum("value")).values("total")
+            ),
+            models.Value(0),
+            output_field=models.DecimalField(max_digits=13, decimal_places=2),
+        ),
+        actual_count=models.functions.Coalesce(
+            models.Subquery(actuals.annotate(count=models.Count("id")).values("count")),
+            models.Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0004_monthlysummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="expenditure",
+            name="actual_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="expenditure",
+            name="actual_total",
+            field=models.DecimalField(
+                decimal_places=2, default=0, editable=False, max_digits=13
+            ),
+        ),
+        migrations.RunPython(compute_actual_total, migrations.RunPython.noop),
+    ]
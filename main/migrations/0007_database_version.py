@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0006_expenditure_search_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="database",
+            name="version",
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+    ]
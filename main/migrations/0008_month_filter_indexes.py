@@ -0,0 +1,44 @@
+# Generated by Django 5.1.6 on 2026-10-18 11:57
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("main", "0007_database_version"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="cash",
+            index=models.Index(
+                condition=models.Q(("income", True)),
+                fields=["db", "reference_date"],
+                name="cash_income_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="cash",
+            index=models.Index(
+                condition=models.Q(("income", False)),
+                fields=["db", "reference_date"],
+                name="cash_money_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expenditure",
+            index=models.Index(
+                fields=["db", "date", "is_expected"], name="expenditure_db_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="expenditure",
+            index=models.Index(
+                fields=["category", "date", "is_expected"],
+                name="expenditure_category_date_idx",
+            ),
+        ),
+    ]
@@ -1,14 +1,270 @@
-from django.db import models
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .search import search as search_expenditures
+
 # Create your models here.
 
 
+def summary_month(date):
+    """First day of the (local) month date belongs to, as used by MonthlySummary."""
+    return (
+        timezone.localtime(date, timezone.get_default_timezone())
+        .date()
+        .replace(day=1)
+    )
+
+
+def month_bounds(month):
+    min_date = timezone.make_aware(
+        datetime(month.year, month.month, 1), timezone.get_default_timezone()
+    )
+    return min_date, min_date + relativedelta(months=1)
+
+
+class SummarizedQuerySet(models.QuerySet):
+    """QuerySet whose bulk operations keep MonthlySummary and Database.version up to date."""
+
+    # Fields derived from other rows, updating them alone does not change the database
+    derived_fields = []
+
+    def summary_keys(self):
+        model = self.model
+        month = TruncMonth(
+            model.summary_date_field,
+            output_field=models.DateField(),
+            tzinfo=timezone.get_default_timezone(),
+        )
+        category = (
+            models.F('category') if model.summary_by_category
+            else models.Value(None, output_field=models.IntegerField())
+        )
+        return set(
+            self.filter(**{f'{model.summary_date_field}__isnull': False})
+            .order_by()
+            .annotate(summary_month=month, summary_category=category)
+            .values_list('db', 'summary_month', 'summary_category')
+            .distinct()
+        )
+
+    def _touches_summary(self, fields):
+        return bool(set(fields) & set(self.model.summary_fields))
+
+    def update(self, **kwargs):
+        if set(kwargs) <= set(self.derived_fields):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            pks, db_ids = set(), set()
+            for pk, db_id in self.values_list('pk', 'db'):
+                pks.add(pk)
+                db_ids.add(db_id)
+            keys = set()
+            if self._touches_summary(kwargs):
+                keys = self.model.objects.filter(pk__in=pks).summary_keys()
+            rows = super().update(**kwargs)
+            if self._touches_summary(kwargs):
+                keys |= self.model.objects.filter(pk__in=pks).summary_keys()
+                MonthlySummary.objects.refresh(keys)
+            bump_versions(db_ids | {db_id for db_id, _, _ in keys})
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            MonthlySummary.objects.refresh(obj.summary_key() for obj in objs)
+            bump_versions(obj.db_id for obj in objs)
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            keys = set()
+            if self._touches_summary(fields):
+                keys = self.model.objects.filter(
+                    pk__in=[obj.pk for obj in objs]
+                ).summary_keys()
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            if self._touches_summary(fields):
+                keys |= {obj.summary_key() for obj in objs}
+                MonthlySummary.objects.refresh(keys)
+            bump_versions({obj.db_id for obj in objs} | {db_id for db_id, _, _ in keys})
+        return rows
+
+    def delete(self):
+        # post_delete receivers leave the refresh to the queryset, done once for all the rows
+        with transaction.atomic(using=self.db):
+            keys = self.summary_keys()
+            db_ids = set(self.order_by().values_list('db', flat=True).distinct())
+            result = super().delete()
+            MonthlySummary.objects.refresh(keys)
+            bump_versions(db_ids)
+        return result
+
+
+class ExpenditureQuerySet(SummarizedQuerySet):
+    # Fields that, if changed, alter actual_total of the related expected expenditure
+    actual_total_fields = ['value', 'is_expected',
+                           'expected_expenditure', 'expected_expenditure_id']
+    derived_fields = ['actual_total', 'actual_count']
+
+    def expected_ids(self):
+        return set(
+            self.filter(expected_expenditure__isnull=False)
+            .values_list('expected_expenditure', flat=True)
+        )
+
+    def refresh_actual_total(self):
+        """Recompute actual_total and actual_count of the expenditures."""
+        actuals = (
+            Expenditure.objects.filter(
+                expected_expenditure=models.OuterRef('pk'))
+            .order_by()
+            .values('expected_expenditure')
+        )
+        with transaction.atomic(using=self.db):
+            # Locked first, the sums are then computed by a statement that starts after any
+            # concurrent writer of these expenditures committed (see MonthlySummary.refresh)
+            list(self.order_by('pk').select_for_update().values_list('pk', flat=True))
+            return self.update(
+                actual_total=models.functions.Coalesce(
+                    models.Subquery(actuals.annotate(
+                        total=models.Sum('value')).values('total')),
+                    models.Value(0),
+                    output_field=models.DecimalField(
+                        max_digits=13, decimal_places=2),
+                ),
+                actual_count=models.functions.Coalesce(
+                    models.Subquery(actuals.annotate(
+                        count=models.Count('id')).values('count')),
+                    models.Value(0),
+                ),
+            )
+
+    def update(self, **kwargs):
+        if not set(kwargs) & set(self.actual_total_fields):
+            return super().update(**kwargs)
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list('pk', flat=True))
+            expected = Expenditure.objects.filter(pk__in=pks).expected_ids()
+            rows = super().update(**kwargs)
+            expected |= Expenditure.objects.filter(pk__in=pks).expected_ids()
+            Expenditure.objects.filter(pk__in=expected).refresh_actual_total()
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            Expenditure.objects.filter(
+                pk__in={obj.expected_expenditure_id for obj in objs}
+            ).refresh_actual_total()
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        if not set(fields) & set(self.actual_total_fields):
+            return super().bulk_update(objs, fields, *args, **kwargs)
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            expected = Expenditure.objects.filter(
+                pk__in=[obj.pk for obj in objs]).expected_ids()
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            expected |= {obj.expected_expenditure_id for obj in objs}
+            Expenditure.objects.filter(
+                pk__in=expected).refresh_actual_total()
+        return rows
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            expected = self.expected_ids()
+            result = super().delete()
+            Expenditure.objects.filter(pk__in=expected).refresh_actual_total()
+        return result
+
+    def with_prospect(self):
+        """
+        Annotate the figures needed to render the prospect of expenditures:
+        prospect_actual is the total of the actual expenditures of the expected one (itself or the one
+        it is related to), prospect_expected the value of the related expected expenditure.
+        """
+        return self.annotate(
+            prospect_actual=models.Case(
+                models.When(is_expected=True, then=models.F('actual_total')),
+                default=models.F('expected_expenditure__actual_total'),
+            ),
+            prospect_expected=models.F('expected_expenditure__value'),
+        ).prefetch_related(
+            models.Prefetch(
+                'actual_expenditures',
+                queryset=Expenditure.objects.only(
+                    'id', 'expected_expenditure_id'),
+            )
+        )
+
+    def search(self, query_string):
+        """
+        Filter expenditures whose name matches query_string (see main.search), annotating
+        search_rank.
+        """
+        return search_expenditures(self, query_string)
+
+
+class Summarized(models.Model):
+    """Base class of the models aggregated in MonthlySummary."""
+
+    # Field holding the date used to bucket the row into months
+    summary_date_field = None
+    # Whether the row is aggregated per category or per database
+    summary_by_category = False
+    # Fields that, if changed, alter the summary
+    summary_fields = []
+
+    objects = SummarizedQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def summary_key(self):
+        date = getattr(self, self.summary_date_field)
+        return (
+            self.db_id,
+            summary_month(date) if date else None,
+            self.category_id if self.summary_by_category else None,
+        )
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields', None)
+        with transaction.atomic():
+            keys = set()
+            if self.pk and (
+                update_fields is None or set(update_fields) & set(self.summary_fields)
+            ):
+                keys = type(self).objects.filter(pk=self.pk).summary_keys()
+            super().save(*args, **kwargs)
+            keys.add(self.summary_key())
+            MonthlySummary.objects.refresh(keys)
+            bump_versions({self.db_id} | {db_id for db_id, _, _ in keys})
+
+
 class Database(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     users = models.ManyToManyField(to=User, related_name='dbs')
     name = models.CharField(max_length=128)
+    # Bumped whenever the database, its users, cashes, categories or expenditures change
+    version = models.PositiveBigIntegerField(default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            self.version = models.F('version') + 1
+        super().save(*args, **kwargs)
+        if isinstance(self.version, models.expressions.Combinable):
+            self.refresh_from_db(fields=['version'])
+            _delete_cached([_version_cache_key(self.pk)])
 
     def __repr__(self):
         return '<class Database: {}, users:{}>'.format(self.name, ', '.join([i.username for i in self.users.all()]))
@@ -17,7 +273,44 @@ class Database(models.Model):
         return self.name
 
 
-class Cash(models.Model):
+def _delete_cached(keys):
+    keys = list(keys)
+    if not keys:
+        return
+    cache.delete_many(keys)
+    # Requests running before the commit may have cached the old values again
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+VERSION_CACHE_TIMEOUT = 60 * 60
+
+
+def _version_cache_key(db_id):
+    return f'main:db-version:{db_id}'
+
+
+def get_db_version(db_id):
+    """Version of the database, from the cache when available. None if it does not exist."""
+    key = _version_cache_key(db_id)
+    version = cache.get(key)
+    if version is None:
+        version = Database.objects.filter(
+            pk=db_id).values_list('version', flat=True).first()
+        if version is not None:
+            cache.set(key, version, VERSION_CACHE_TIMEOUT)
+    return version
+
+
+def bump_versions(db_ids):
+    """Mark the databases as changed, see Database.version."""
+    db_ids = {db_id for db_id in db_ids if db_id is not None}
+    if db_ids:
+        Database.objects.filter(pk__in=db_ids).update(
+            version=models.F('version') + 1)
+        _delete_cached(_version_cache_key(db_id) for db_id in db_ids)
+
+
+class Cash(Summarized):
     name = models.CharField(max_length=128, null=True)
     value = models.DecimalField(max_digits=11, decimal_places=2)
     date = models.DateTimeField(auto_now=True)
@@ -28,6 +321,20 @@ class Cash(models.Model):
     db = models.ForeignKey(
         to=Database, on_delete=models.CASCADE, related_name='cashes')
 
+    summary_date_field = 'reference_date'
+    summary_fields = ['value', 'reference_date', 'income', 'db', 'db_id']
+
+    class Meta:
+        # Incomes and actual moneys of a database in a range of dates, also sorted by
+        # date. Partial because filters on income are compiled to "income" and
+        # NOT "income", which SQLite does not match against an indexed column.
+        indexes = [
+            models.Index(fields=['db', 'reference_date'], condition=models.Q(income=True),
+                         name='cash_income_date_idx'),
+            models.Index(fields=['db', 'reference_date'], condition=models.Q(income=False),
+                         name='cash_money_date_idx'),
+        ]
+
     def __str__(self):
         return 'DT:{} {}€'.format(timezone.localtime(self.reference_date).strftime('%Y-%m'), self.value)
 
@@ -48,7 +355,7 @@ class Category(models.Model):
         return '<class Category (for db {}): {}>'.format(self.db.name, self.name)
 
 
-class Expenditure(models.Model):
+class Expenditure(Summarized):
     name = models.CharField(max_length=128)
     value = models.DecimalField(max_digits=11, decimal_places=2)
     date = models.DateTimeField(null=True)
@@ -64,7 +371,30 @@ class Expenditure(models.Model):
     expected_expenditure = models.ForeignKey(
         to='self', null=True, blank=True, on_delete=models.SET_NULL, related_name='actual_expenditures')
 
-    def save(self, *args, **kwargs):
+    # Total and number of actual_expenditures, only meaningful for expected expenditures
+    actual_total = models.DecimalField(
+        max_digits=13, decimal_places=2, default=0, editable=False)
+    actual_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ExpenditureQuerySet.as_manager()
+
+    summary_date_field = 'date'
+    summary_by_category = True
+    summary_fields = ['value', 'date', 'is_expected',
+                      'category', 'category_id', 'db', 'db_id']
+
+    class Meta:
+        indexes = [
+            # Expenditures of a database or category in a month, is_expected is
+            # checked on the index
+            models.Index(fields=['db', 'date', 'is_expected'],
+                         name='expenditure_db_date_idx'),
+            models.Index(fields=['category', 'date', 'is_expected'],
+                         name='expenditure_category_date_idx'),
+        ]
+
+    def fill_derived_fields(self):
+        """Set the fields derived from the others, also used before bulk creations."""
         self.db = self.category.db
         if not self.date:
             # must have a reference_date
@@ -72,7 +402,24 @@ class Expenditure(models.Model):
         if self.is_expected:
             # this is a expected expenditure, can not have related expected expenditure
             self.expected_expenditure = None
-        super(Expenditure, self).save(*args, **kwargs)
+
+    def save(self, *args, **kwargs):
+        self.fill_derived_fields()
+        with transaction.atomic():
+            expected = set()
+            if self.pk:
+                expected = Expenditure.objects.filter(pk=self.pk).expected_ids()
+            super(Expenditure, self).save(*args, **kwargs)
+            expected.add(self.expected_expenditure_id)
+            if self.is_expected:
+                # Saving may have overwritten actual_total with a stale value
+                expected.add(self.pk)
+            Expenditure.objects.filter(pk__in=expected).refresh_actual_total()
+            if self.is_expected:
+                self.refresh_from_db(fields=['actual_total', 'actual_count'])
+            elif self.expected_expenditure_id and Expenditure.expected_expenditure.is_cached(self):
+                self.expected_expenditure.refresh_from_db(
+                    fields=['actual_total', 'actual_count'])
 
     def __str__(self):
         return self.name
@@ -81,3 +428,270 @@ class Expenditure(models.Model):
         return '<class Expenditure (for db {}): {} ({})>'.format(self.db.name,
                                                                  self.value,
                                                                  self.name)
+
+
+class MonthlySummaryManager(models.Manager):
+    def _compute(self, db_id, month, category_id):
+        min_date, max_date = month_bounds(month)
+        if category_id is not None:
+            figures = (
+                Expenditure.objects.filter(db_id=db_id, category_id=category_id, date__gte=min_date, date__lt=max_date)
+                .aggregate(
+                    expected_expenditure=models.Sum(
+                        'value', filter=models.Q(is_expected=True), default=0),
+                    actual_expenditure=models.Sum(
+                        'value', filter=models.Q(is_expected=False), default=0),
+                    count=models.Count('id'),
+                )
+            )
+            return figures if figures.pop('count') else None
+
+        cashes = Cash.objects.filter(
+            db_id=db_id, reference_date__gte=min_date, reference_date__lt=max_date)
+        income = cashes.filter(income=True).aggregate(
+            income=models.Sum('value'))['income']
+        cash = cashes.filter(income=False).order_by(
+            'reference_date', 'id').last()
+        if income is None and cash is None:
+            return None
+        return {
+            'income': income or 0,
+            'cash': cash,
+            'cash_value': getattr(cash, 'value', None),
+        }
+
+    def refresh(self, keys):
+        """Recompute the summaries identified by (db id, month, category id) keys."""
+        # In the same order in every transaction, so that they do not deadlock
+        keys = sorted(
+            {key for key in keys if key[0] is not None and key[1] is not None},
+            key=lambda key: (key[0], key[1], key[2] or 0),
+        )
+        with transaction.atomic(using=self.db):
+            for db_id, month, category_id in keys:
+                lookup = {'db_id': db_id, 'month': month,
+                          'category_id': category_id}
+                # The row is locked before computing: a concurrent writer of the same summary
+                # waits for this transaction to commit and then computes with its changes,
+                # instead of overwriting them with a sum that misses them
+                summary, _ = self.select_for_update().get_or_create(**lookup)
+                figures = self._compute(db_id, month, category_id)
+                if figures is None:
+                    summary.delete()
+                else:
+                    for field, value in figures.items():
+                        setattr(summary, field, value)
+                    summary.save()
+
+    def rebuild(self, databases=None):
+        """Drop and recompute every summary, optionally only for the given databases."""
+        expenditures = Expenditure.objects.filter(date__isnull=False)
+        cashes = Cash.objects.all()
+        summaries = self.all()
+        if databases is not None:
+            expenditures = expenditures.filter(db__in=databases)
+            cashes = cashes.filter(db__in=databases)
+            summaries = summaries.filter(db__in=databases)
+
+        def month(field):
+            return TruncMonth(field, output_field=models.DateField(), tzinfo=timezone.get_default_timezone())
+
+        rebuilt = {}
+
+        def get(db_id, month, category_id=None):
+            key = (db_id, month, category_id)
+            if key not in rebuilt:
+                rebuilt[key] = self.model(
+                    db_id=db_id, month=month, category_id=category_id)
+            return rebuilt[key]
+
+        with transaction.atomic():
+            summaries.delete()
+            for row in (
+                expenditures.order_by()
+                .annotate(month=month('date'))
+                .values('db', 'month', 'category')
+                .annotate(
+                    expected=models.Sum(
+                        'value', filter=models.Q(is_expected=True), default=0),
+                    actual=models.Sum(
+                        'value', filter=models.Q(is_expected=False), default=0),
+                )
+            ):
+                summary = get(row['db'], row['month'], row['category'])
+                summary.expected_expenditure = row['expected']
+                summary.actual_expenditure = row['actual']
+            for row in (
+                cashes.filter(income=True)
+                .order_by()
+                .annotate(month=month('reference_date'))
+                .values('db', 'month')
+                .annotate(income=models.Sum('value'))
+            ):
+                get(row['db'], row['month']).income = row['income']
+            for cash_id, db_id, reference_date, value in (
+                cashes.filter(income=False)
+                .order_by('reference_date', 'id')
+                .values_list('id', 'db', 'reference_date', 'value')
+                .iterator()
+            ):
+                summary = get(db_id, summary_month(reference_date))
+                summary.cash_id = cash_id
+                summary.cash_value = value
+            self.bulk_create(rebuilt.values(), batch_size=500)
+        return len(rebuilt)
+
+
+class MonthlySummary(models.Model):
+    """
+    Figures of a database for a month, kept up to date on every write of Expenditure and Cash.
+    Rows with a category hold expenditures of that category, the row without category holds
+    incomes and the latest cash registration of the month.
+    """
+
+    db = models.ForeignKey(
+        to=Database, on_delete=models.CASCADE, related_name='monthly_summaries')
+    # First day of the month, in local time
+    month = models.DateField()
+    category = models.ForeignKey(
+        to=Category, null=True, blank=True, on_delete=models.CASCADE, related_name='monthly_summaries')
+
+    expected_expenditure = models.DecimalField(
+        max_digits=13, decimal_places=2, default=0)
+    actual_expenditure = models.DecimalField(
+        max_digits=13, decimal_places=2, default=0)
+    income = models.DecimalField(max_digits=13, decimal_places=2, default=0)
+    # Latest cash registration (not income) of the month
+    cash = models.ForeignKey(
+        to=Cash, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    cash_value = models.DecimalField(
+        max_digits=11, decimal_places=2, null=True, blank=True)
+
+    objects = MonthlySummaryManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['db', 'month', 'category'], name='unique_monthly_summary'),
+            models.UniqueConstraint(
+                fields=['db', 'month'], condition=models.Q(category=None), name='unique_monthly_db_summary'),
+        ]
+
+    def __str__(self):
+        return '{} {}'.format(self.db_id, self.month.strftime('%Y-%m'))
+
+    def __repr__(self):
+        return '<class MonthlySummary (for db {}): {} category {}>'.format(self.db_id, self.month.strftime('%Y-%m'), self.category_id)
+
+
+def _deleted_with(origin, model):
+    # Summaries of deleted databases and categories are deleted in cascade
+    return isinstance(origin, model) or getattr(origin, 'model', None) is model
+
+
+def _deleted_by_queryset(origin, model):
+    # SummarizedQuerySet.delete refreshes everything at once
+    return isinstance(origin, SummarizedQuerySet) and origin.model is model
+
+
+@receiver(post_delete, sender=Cash)
+@receiver(post_delete, sender=Expenditure)
+def refresh_summary_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, Database) or _deleted_with(origin, Category):
+        return
+    if _deleted_by_queryset(origin, sender):
+        return
+    MonthlySummary.objects.refresh([instance.summary_key()])
+
+
+@receiver(post_delete, sender=Cash)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Expenditure)
+def bump_version_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_with(origin, Database) or _deleted_by_queryset(origin, sender):
+        return
+    if sender is not Category and _deleted_with(origin, Category):
+        # Bumped once for the category
+        return
+    bump_versions([instance.db_id])
+
+
+@receiver(post_save, sender=Category)
+def bump_version_on_save(sender, instance, **kwargs):
+    bump_versions([instance.db_id])
+
+
+@receiver(post_delete, sender=Expenditure)
+def refresh_actual_total_on_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_by_queryset(origin, sender) or _deleted_with(origin, Database):
+        return
+    if not instance.expected_expenditure_id:
+        return
+    if origin is None or isinstance(origin, Expenditure):
+        Expenditure.objects.filter(
+            pk=instance.expected_expenditure_id).refresh_actual_total()
+        return
+    # Deleted in cascade: refreshed at once by refresh_actual_totals_after_cascade
+    if not hasattr(origin, '_expected_ids_to_refresh'):
+        origin._expected_ids_to_refresh = set()
+    origin._expected_ids_to_refresh.add(instance.expected_expenditure_id)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=User)
+def refresh_actual_totals_after_cascade(sender, instance, origin=None, **kwargs):
+    # The expenditures depending on the deleted categories and users are deleted first
+    expected = getattr(origin, '_expected_ids_to_refresh', None)
+    if expected:
+        del origin._expected_ids_to_refresh
+        Expenditure.objects.filter(pk__in=expected).refresh_actual_total()
+
+
+# Membership of users to databases, cached since it is checked by every request
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60
+
+
+def _membership_cache_key(user_id):
+    return f'main:user-dbs:{user_id}'
+
+
+def get_user_db_ids(user):
+    """Ids of the databases user belongs to, from the cache when available."""
+    if user.pk is None:
+        return frozenset()
+    key = _membership_cache_key(user.pk)
+    db_ids = cache.get(key)
+    if db_ids is None:
+        db_ids = frozenset(
+            Database.objects.filter(users=user).values_list('id', flat=True))
+        cache.set(key, db_ids, MEMBERSHIP_CACHE_TIMEOUT)
+    return db_ids
+
+
+def invalidate_user_db_ids(user_ids):
+    _delete_cached(_membership_cache_key(user_id) for user_id in user_ids)
+
+
+@receiver(m2m_changed, sender=Database.users.through)
+def membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        # pk_set is not provided when clearing
+        related = instance.dbs if reverse else instance.users
+        instance._cleared_pks = set(related.values_list('id', flat=True))
+        return
+    if action not in ['post_add', 'post_remove', 'post_clear']:
+        return
+    if action == 'post_clear':
+        pk_set = getattr(instance, '_cleared_pks', set())
+    if reverse:
+        # user.dbs changed
+        user_ids, db_ids = [instance.pk], pk_set
+    else:
+        user_ids, db_ids = pk_set, [instance.pk]
+    invalidate_user_db_ids(user_ids)
+    bump_versions(db_ids)
+
+
+@receiver(pre_delete, sender=Database)
+def invalidate_membership_on_delete(sender, instance, **kwargs):
+    invalidate_user_db_ids(instance.users.values_list('id', flat=True))
@@ -0,0 +1,184 @@
+"""
+Full-text search over expenditure names.
+
+On SQLite the names are indexed in an FTS5 table kept in sync by triggers, on PostgreSQL by a GIN
+index on their tsvector. Terms match the beginning of the words of the name and results can be
+ranked by relevance. Other databases fall back to icontains lookups.
+
+SQLite drops triggers when a migration remakes the expenditure table: after every migrate,
+install_missing() installs the index again if any part of it is missing.
+"""
+from django.db import connections, models
+from django.db.migrations.recorder import MigrationRecorder
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'main_expenditure_fts'
+PG_INDEX = 'main_expenditure_name_search'
+INDEX_MIGRATION = ('main', '0006_expenditure_search_index')
+
+SQLITE_INSTALL = [
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, content='main_expenditure', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON main_expenditure BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON main_expenditure BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF name ON main_expenditure BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO {FTS_TABLE}(rowid, name) VALUES (new.id, new.name);
+    END''',
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+SQLITE_OBJECTS = [
+    FTS_TABLE,
+    f'{FTS_TABLE}_insert',
+    f'{FTS_TABLE}_delete',
+    f'{FTS_TABLE}_update',
+]
+
+SQLITE_UNINSTALL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+POSTGRESQL_INSTALL = [
+    f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON main_expenditure USING GIN (to_tsvector('simple', name))",
+]
+
+POSTGRESQL_UNINSTALL = [
+    f'DROP INDEX IF EXISTS {PG_INDEX}',
+]
+
+
+def _execute(connection, statements):
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def install(connection):
+    """Create (or recreate) the search index of the database behind connection."""
+    if connection.vendor == 'sqlite':
+        _execute(connection, SQLITE_UNINSTALL + SQLITE_INSTALL)
+    elif connection.vendor == 'postgresql':
+        _execute(connection, POSTGRESQL_INSTALL)
+
+
+def uninstall(connection):
+    if connection.vendor == 'sqlite':
+        _execute(connection, SQLITE_UNINSTALL)
+    elif connection.vendor == 'postgresql':
+        _execute(connection, POSTGRESQL_UNINSTALL)
+
+
+def is_installed(connection):
+    """Whether every part of the search index exists in the database behind connection."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(
+                'SELECT COUNT(*) FROM sqlite_master WHERE name IN ({})'.format(
+                    ', '.join(['%s'] * len(SQLITE_OBJECTS))),
+                SQLITE_OBJECTS)
+            return cursor.fetchone()[0] == len(SQLITE_OBJECTS)
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT COUNT(*) FROM pg_indexes WHERE indexname = %s', [PG_INDEX])
+            return cursor.fetchone()[0] == 1
+    return True
+
+
+def install_missing(using, **kwargs):
+    """
+    post_migrate receiver: install the index again if a migration dropped part of it, as
+    SQLite does with the triggers when the expenditure table is remade.
+    """
+    connection = connections[using]
+    recorder = MigrationRecorder(connection)
+    if not recorder.has_table() or INDEX_MIGRATION not in recorder.applied_migrations():
+        return
+    if not is_installed(connection):
+        install(connection)
+
+
+def parse_query_string(query_string):
+    """
+    Split a queryString into groups of terms: groups are separated by commas and matched in OR,
+    terms of a group are separated by spaces and matched in AND.
+    """
+    groups = [
+        [term for term in group.strip().split(' ') if term]
+        for group in query_string.split(',')
+    ]
+    return [group for group in groups if group]
+
+
+def _fts5_match(groups):
+    return ' OR '.join(
+        '({})'.format(' AND '.join(
+            '"{}"*'.format(term.replace('"', '""')) for term in group))
+        for group in groups
+    )
+
+
+def _tsquery(groups):
+    def lexeme(term):
+        return "'{}':*".format(term.replace('\\', '\\\\').replace("'", "''"))
+
+    return ' | '.join(
+        '({})'.format(' & '.join(lexeme(term) for term in group))
+        for group in groups
+    )
+
+
+def _icontains(groups):
+    query = models.Q()
+    for group in groups:
+        and_query = models.Q()
+        for term in group:
+            and_query &= models.Q(name__icontains=term)
+        query |= and_query
+    return query
+
+
+def search(queryset, query_string):
+    """
+    Filter queryset (of expenditures) by query_string, annotating search_rank: the higher the
+    more relevant.
+    """
+    groups = parse_query_string(query_string)
+    if not groups:
+        return queryset.annotate(search_rank=models.Value(0.0))
+    table = queryset.model._meta.db_table
+    vendor = connections[queryset.db].vendor
+    if vendor == 'sqlite':
+        match = _fts5_match(groups)
+        return queryset.filter(
+            id__in=RawSQL(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        ).annotate(
+            # FTS5 rank is lower for better matches
+            search_rank=RawSQL(
+                f'SELECT -rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id"',
+                [match],
+                output_field=models.FloatField(),
+            )
+        )
+    if vendor == 'postgresql':
+        query = _tsquery(groups)
+        vector = f'to_tsvector(\'simple\', "{table}"."name")'
+        return queryset.filter(
+            RawSQL(f"{vector} @@ to_tsquery('simple', %s)",
+                   [query], output_field=models.BooleanField())
+        ).annotate(
+            search_rank=RawSQL(
+                f"ts_rank({vector}, to_tsquery('simple', %s))",
+                [query],
+                output_field=models.FloatField(),
+            )
+        )
+    return queryset.filter(_icontains(groups)).annotate(search_rank=models.Value(0.0))
@@ -0,0 +1,116 @@
+"""
+Synthetic databases, for benchmarks and for trying the API with realistic amounts of data.
+
+Every month of a generated database has a salary and sometimes another income, one or two
+actual money registrations, a budget (expected expenditure) for about half of the categories
+and expenditures spread over all the categories, most of them linked to the budget of their
+category when there is one.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cash, Category, Database, Expenditure, month_bounds, summary_month
+
+CATEGORY_NAMES = [
+    'rent', 'groceries', 'utilities', 'transport', 'health', 'fun', 'travel', 'gifts',
+    'education', 'insurance', 'restaurants', 'clothes', 'home', 'pets', 'sport',
+]
+
+EXPENDITURE_NAMES = [
+    'supermarket', 'pharmacy', 'train ticket', 'fuel', 'dinner', 'cinema', 'bill',
+    'subscription', 'hotel', 'books', 'shoes', 'repair', 'vet', 'gym', 'present',
+]
+
+BATCH_SIZE = 1000
+
+
+def _money(rng, low, high):
+    return Decimal(rng.randint(low * 100, high * 100)) / 100
+
+
+def _date_in(rng, min_date, max_date):
+    seconds = int((max_date - min_date).total_seconds()) - 1
+    return min_date + timedelta(seconds=rng.randint(0, seconds))
+
+
+@transaction.atomic
+def generate_database(name='synthetic', users=3, categories=10, years=2,
+                      expenditures=40, end=None, seed=None, password='synthetic'):
+    """
+    Create a database with users users (all with password), categories categories and
+    years years of cashes and expenditures, expenditures per month, up to the month of end
+    (now by default). The same seed generates the same data.
+    """
+    rng = random.Random(seed)
+    database = Database.objects.create(name=name)
+
+    hashed = make_password(password)
+    members = User.objects.bulk_create(
+        User(username=f'{name}-{database.pk}-{i}', password=hashed)
+        for i in range(users)
+    )
+    database.users.add(*members)
+
+    db_categories = Category.objects.bulk_create(
+        Category(
+            name=(CATEGORY_NAMES[i % len(CATEGORY_NAMES)]
+                  + (f' {i // len(CATEGORY_NAMES)}' if i >= len(CATEGORY_NAMES) else '')),
+            db=database,
+        )
+        for i in range(categories)
+    )
+    budgeted = db_categories[::2]
+
+    last = summary_month(end or timezone.now())
+    months = [last - relativedelta(months=i) for i in reversed(range(years * 12))]
+
+    cashes = []
+    expected = []
+    money = _money(rng, 1000, 5000)
+    for month in months:
+        min_date, max_date = month_bounds(month)
+        salary_date = min_date + timedelta(days=rng.randint(0, 4))
+        cashes.append(Cash(name='salary', value=_money(rng, 1800, 2600),
+                           reference_date=salary_date, income=True, db=database))
+        if rng.random() < 0.2:
+            cashes.append(Cash(name='bonus', value=_money(rng, 100, 1000),
+                               reference_date=_date_in(rng, min_date, max_date),
+                               income=True, db=database))
+        for _ in range(rng.randint(1, 2)):
+            money += _money(rng, -400, 500)
+            cashes.append(Cash(value=money,
+                               reference_date=_date_in(rng, max_date - timedelta(days=5), max_date),
+                               db=database))
+        expected += [
+            Expenditure(name=f'{category.name} budget', value=_money(rng, 50, 900),
+                        date=min_date, is_expected=True, category=category, db=database,
+                        user=rng.choice(members))
+            for category in budgeted
+        ]
+    Cash.objects.bulk_create(cashes, batch_size=BATCH_SIZE)
+    Expenditure.objects.bulk_create(expected, batch_size=BATCH_SIZE)
+
+    budgets = {(e.category_id, summary_month(e.date)): e for e in expected}
+    actual = []
+    for month in months:
+        min_date, max_date = month_bounds(month)
+        for _ in range(expenditures):
+            category = rng.choice(db_categories)
+            budget = budgets.get((category.pk, month), None)
+            actual.append(Expenditure(
+                name=rng.choice(EXPENDITURE_NAMES), value=_money(rng, 2, 150),
+                date=_date_in(rng, min_date, max_date), category=category, db=database,
+                user=rng.choice(members),
+                expected_expenditure=budget if budget and rng.random() < 0.7 else None,
+            ))
+    Expenditure.objects.bulk_create(actual, batch_size=BATCH_SIZE)
+    # bulk_create does not maintain the totals of the budgets
+    Expenditure.objects.filter(pk__in=[e.pk for e in expected]).refresh_actual_total()
+    return database
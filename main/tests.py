@@ -1,3 +1,415 @@
-from django.test import TestCase
+from datetime import date
+from decimal import Decimal
 
-# Create your tests here.
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from main import search
+from main.models import Database, Cash, Category, Expenditure, MonthlySummary
+from main.security import TokenCache, token_cache
+
+
+@pytest.fixture
+def category(database):
+    return Category.objects.create(name="food", db=database)
+
+
+def summaries(database):
+    return {
+        (s.month, s.category_id): (
+            s.expected_expenditure,
+            s.actual_expenditure,
+            s.income,
+            s.cash_id,
+        )
+        for s in MonthlySummary.objects.filter(db=database)
+    }
+
+
+def assert_consistent(database):
+    maintained = summaries(database)
+    MonthlySummary.objects.rebuild([database.id])
+    assert maintained == summaries(database)
+
+
+def test_summary_follows_expenditure_writes(user, database, category, aware):
+    expenditure = Expenditure.objects.create(
+        name="bread", value=3, date=aware(2025, 1, 10), category=category, user=user
+    )
+    Expenditure.objects.create(
+        name="food",
+        value=100,
+        date=aware(2025, 1, 1),
+        is_expected=True,
+        category=category,
+        user=user,
+    )
+    summary = MonthlySummary.objects.get(db=database, category=category)
+    assert summary.month == date(2025, 1, 1)
+    assert summary.expected_expenditure == Decimal(100)
+    assert summary.actual_expenditure == Decimal(3)
+
+    # Moving the expenditure to another month updates both months
+    expenditure.date = aware(2025, 2, 10)
+    expenditure.save()
+    assert summaries(database) == {
+        (date(2025, 1, 1), category.id): (Decimal(100), Decimal(0), Decimal(0), None),
+        (date(2025, 2, 1), category.id): (Decimal(0), Decimal(3), Decimal(0), None),
+    }
+
+    expenditure.delete()
+    assert set(summaries(database)) == {(date(2025, 1, 1), category.id)}
+    assert_consistent(database)
+
+
+def test_summary_follows_cash_writes(database, aware):
+    Cash.objects.create(value=100, reference_date=aware(2025, 1, 5), db=database)
+    latest = Cash.objects.create(
+        value=200, reference_date=aware(2025, 1, 25), db=database
+    )
+    Cash.objects.create(
+        value=50, reference_date=aware(2025, 1, 1), income=True, db=database
+    )
+    summary = MonthlySummary.objects.get(db=database, category=None)
+    assert summary.income == Decimal(50)
+    assert summary.cash == latest
+    assert summary.cash_value == Decimal(200)
+
+    # Saving an existing cash refreshes the summaries of its old and new months
+    latest.value = 300
+    latest.save()
+    summary.refresh_from_db()
+    assert summary.cash_value == Decimal(300)
+    latest.reference_date = aware(2025, 2, 3)
+    latest.save()
+    summary.refresh_from_db()
+    assert summary.cash_value == Decimal(100)
+    assert MonthlySummary.objects.get(
+        db=database, category=None, month=date(2025, 2, 1)
+    ).cash_value == Decimal(300)
+
+    latest.delete()
+    summary.refresh_from_db()
+    assert summary.cash_value == Decimal(100)
+    assert_consistent(database)
+
+
+def test_summary_follows_bulk_operations(user, database, category, aware):
+    other = Category.objects.create(name="fun", db=database)
+    Expenditure.objects.bulk_create(
+        [
+            Expenditure(
+                name=str(i),
+                value=i,
+                date=aware(2025, 3, i + 1),
+                category=category,
+                db=database,
+                user=user,
+            )
+            for i in range(1, 5)
+        ]
+    )
+    assert MonthlySummary.objects.get(category=category).actual_expenditure == 10
+
+    Expenditure.objects.filter(value__gte=3).update(category=other)
+    assert MonthlySummary.objects.get(category=category).actual_expenditure == 3
+    assert MonthlySummary.objects.get(category=other).actual_expenditure == 7
+
+    Expenditure.objects.filter(category=other).delete()
+    assert not MonthlySummary.objects.filter(category=other).exists()
+    assert_consistent(database)
+
+
+def test_summary_deleted_with_category(user, database, category, aware):
+    Expenditure.objects.create(
+        name="bread", value=3, date=aware(2025, 1, 10), category=category, user=user
+    )
+    category.delete()
+    assert not MonthlySummary.objects.filter(db=database).exists()
+
+
+def test_rebuild_command(user, database, category, aware):
+    Expenditure.objects.create(
+        name="bread", value=3, date=aware(2025, 1, 10), category=category, user=user
+    )
+    Cash.objects.create(value=100, reference_date=aware(2025, 1, 5), db=database)
+    expected = summaries(database)
+    MonthlySummary.objects.all().delete()
+
+    call_command("rebuild_monthly_summaries", "--db", str(database.id))
+    assert summaries(database) == expected
+
+
+def test_generate_synthetic_data(db):
+    call_command("generate_synthetic_data", "--seed", "1", "--years", "1")
+    database = Database.objects.get()
+    assert database.users.count() == 3
+    assert database.categories.count() == 10
+    assert database.expenditures.filter(is_expected=False).count() == 12 * 40
+    assert database.cashes.filter(income=True).count() >= 12
+
+    # Summaries and actual totals are consistent with the generated rows
+    expected = summaries(database)
+    MonthlySummary.objects.rebuild([database.id])
+    assert summaries(database) == expected
+    budgets = database.expenditures.filter(is_expected=True, actual_count__gt=0)
+    assert budgets.exists()
+    for budget in budgets:
+        actuals = budget.actual_expenditures.all()
+        assert budget.actual_total == sum(actual.value for actual in actuals)
+
+    # Same seed, same data
+    call_command("generate_synthetic_data", "--seed", "1", "--years", "1")
+    other = Database.objects.exclude(pk=database.pk).get()
+    assert list(other.expenditures.order_by("id").values_list("name", "value")) == list(
+        database.expenditures.order_by("id").values_list("name", "value")
+    )
+
+
+def test_actual_total_follows_actual_expenditures(user, database, category, aware):
+    expected = Expenditure.objects.create(
+        name="food",
+        value=100,
+        date=aware(2025, 1, 1),
+        is_expected=True,
+        category=category,
+        user=user,
+    )
+    other = Expenditure.objects.create(
+        name="more food",
+        value=50,
+        date=aware(2025, 1, 1),
+        is_expected=True,
+        category=category,
+        user=user,
+    )
+    bread = Expenditure.objects.create(
+        name="bread",
+        value=3,
+        date=aware(2025, 1, 10),
+        category=category,
+        user=user,
+        expected_expenditure=expected,
+    )
+    assert bread.expected_expenditure.actual_total == Decimal(3)
+    Expenditure.objects.bulk_create(
+        [
+            Expenditure(
+                name="milk",
+                value=2,
+                date=aware(2025, 1, 11),
+                category=category,
+                db=database,
+                user=user,
+                expected_expenditure=expected,
+            )
+        ]
+    )
+    expected.refresh_from_db()
+    assert (expected.actual_total, expected.actual_count) == (Decimal(5), 2)
+
+    # Saving the expected expenditure does not overwrite the total
+    stale = Expenditure.objects.get(pk=expected.pk)
+    Expenditure.objects.filter(name="milk").update(value=4)
+    stale.name = "groceries"
+    stale.save()
+    assert stale.actual_total == Decimal(7)
+
+    # Relinking moves the value to the other expected expenditure
+    bread.expected_expenditure = other
+    bread.save()
+    expected.refresh_from_db()
+    other.refresh_from_db()
+    assert (expected.actual_total, expected.actual_count) == (Decimal(4), 1)
+    assert (other.actual_total, other.actual_count) == (Decimal(3), 1)
+
+    bread.delete()
+    other.refresh_from_db()
+    assert (other.actual_total, other.actual_count) == (Decimal(0), 0)
+
+
+def test_actual_total_refreshed_once_on_cascade(user, database, category, aware):
+    other_user = User.objects.create_user("carol", "carol@example.com", "password")
+    database.users.add(other_user)
+    budgets = [
+        Expenditure.objects.create(
+            name=f"budget {i}",
+            value=100,
+            date=aware(2025, 1, 1),
+            is_expected=True,
+            category=category,
+            user=other_user,
+        )
+        for i in range(2)
+    ]
+    for i in range(6):
+        Expenditure.objects.create(
+            name=f"bread {i}",
+            value=1,
+            date=aware(2025, 1, 10),
+            category=category,
+            user=user if i % 3 else other_user,
+            expected_expenditure=budgets[i % 2],
+        )
+
+    with CaptureQueriesContext(connection) as context:
+        user.delete()
+    refreshes = [
+        query
+        for query in context.captured_queries
+        if query["sql"].startswith('UPDATE "main_expenditure" SET "actual_total"')
+    ]
+    assert len(refreshes) == 1
+    for budget in budgets:
+        budget.refresh_from_db()
+    assert [(b.actual_total, b.actual_count) for b in budgets] == [
+        (Decimal(1), 1),
+        (Decimal(1), 1),
+    ]
+
+    category.delete()
+    assert not Expenditure.objects.exists()
+
+
+def test_check_actual_totals_command(user, database, category, aware):
+    expected = Expenditure.objects.create(
+        name="food",
+        value=100,
+        date=aware(2025, 1, 1),
+        is_expected=True,
+        category=category,
+        user=user,
+    )
+    Expenditure.objects.create(
+        name="bread",
+        value=3,
+        date=aware(2025, 1, 10),
+        category=category,
+        user=user,
+        expected_expenditure=expected,
+    )
+    Expenditure.objects.filter(pk=expected.pk).update(actual_total=10)
+
+    call_command("check_actual_totals")
+    expected.refresh_from_db()
+    assert expected.actual_total == Decimal(10)
+
+    call_command("check_actual_totals", "--repair")
+    expected.refresh_from_db()
+    assert expected.actual_total == Decimal(3)
+
+
+def test_token_authentication_is_cached(user, database):
+    token_cache.clear()
+    token = Token.objects.create(user=user)
+    client = APIClient()
+    client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+    def get():
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(f"/v3/dbs/{database.id}/")
+        authtoken_queries = [
+            query
+            for query in context.captured_queries
+            if "authtoken_token" in query["sql"]
+        ]
+        return response.status_code, len(authtoken_queries)
+
+    assert get() == (200, 1)
+    assert get() == (200, 0)
+
+    user.is_active = False
+    user.save()
+    assert get() == (401, 1)
+    user.is_active = True
+    user.save()
+    assert get() == (200, 1)
+
+    token.delete()
+    assert get()[0] == 401
+
+
+def test_token_cache_is_bounded():
+    cache = TokenCache(maxsize=2, ttl=60)
+    users = [User(pk=i) for i in range(3)]
+    for i, user in enumerate(users):
+        cache.set(f"key {i}", (user, None))
+        cache.get("key 0")
+    # The least recently used entry is dropped
+    assert cache.get("key 1") is None
+    assert cache.get("key 0") == (users[0], None)
+
+    cache.invalidate_user(0)
+    assert cache.get("key 0") is None
+
+    expired = TokenCache(ttl=-1)
+    expired.set("key 0", (users[0], None))
+    assert expired.get("key 0") is None
+
+
+def test_database_version(user, database, category, aware):
+    def changes(operation):
+        database.refresh_from_db()
+        version = database.version
+        operation()
+        database.refresh_from_db()
+        return database.version - version
+
+    expenditure = Expenditure(
+        name="bread", value=3, date=aware(2025, 1, 10), category=category, user=user
+    )
+    assert changes(expenditure.save)
+    assert changes(
+        lambda: Expenditure.objects.filter(pk=expenditure.pk).update(name="x")
+    )
+    assert changes(
+        lambda: Cash.objects.create(
+            value=100, reference_date=aware(2025, 1, 5), db=database
+        )
+    )
+    assert changes(lambda: Category.objects.create(name="fun", db=database))
+    assert changes(lambda: database.users.remove(user))
+    assert changes(lambda: user.dbs.add(database))
+    assert changes(lambda: Expenditure.objects.filter(pk=expenditure.pk).delete())
+    # Deleting a category bumps the version once, not for every expenditure
+    Expenditure.objects.create(
+        name="milk", value=3, date=aware(2025, 1, 10), category=category, user=user
+    )
+    assert changes(category.delete) == 1
+    database.name = "house"
+    assert changes(database.save) == 1
+
+
+@pytest.mark.skipif(connection.vendor != "sqlite", reason="SQLite triggers")
+def test_search_index_survives_table_remakes(transactional_db, aware):
+    # As a migration altering Expenditure, SQLite remakes the table and drops its triggers
+    field = Expenditure._meta.get_field("name")
+    altered = field.clone()
+    altered.set_attributes_from_name("name")
+    altered.max_length = field.max_length + 1
+    with connection.schema_editor() as editor:
+        editor.alter_field(Expenditure, field, altered)
+    try:
+        assert not search.is_installed(connection)
+        call_command("migrate", verbosity=0)
+        assert search.is_installed(connection)
+    finally:
+        with connection.schema_editor() as editor:
+            editor.alter_field(Expenditure, altered, field)
+        call_command("migrate", verbosity=0)
+
+    user = User.objects.create_user("carol")
+    database = Database.objects.create(name="search")
+    database.users.add(user)
+    category = Category.objects.create(name="misc", db=database)
+    Expenditure.objects.create(
+        name="bread", value=3, date=aware(2025, 1, 10), category=category, user=user
+    )
+    assert [e.name for e in search.search(Expenditure.objects.all(), "bre")] == [
+        "bread"
+    ]